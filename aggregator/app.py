@@ -1,24 +1,40 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, Response, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import asyncio
 import logging
 import os
+import time
 import redis.asyncio as redis
 from datetime import datetime, timezone
-import json
 import uuid
 
-from database import Database
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+import codec
+import metrics
+from logging_config import setup_logging
+from latency import tracker as latency_tracker
+from codec import CodecJSONResponse
+from database import Database, is_transient_error
+from events import (
+    parse_timestamp, parse_time_range, render_events_response, render_export, EXPORT_FORMATS,
+    encode_cursor, decode_cursor, encode_queue_message, decode_queue_message
 )
+from coalescer import create_coalescer
+from stream_ingest import StreamRejected, ingest_ndjson
+from backpressure import create_backpressure
+from queue_backend import create_queue
+from edge_dedup import create_edge_dedup
+from batch_status import create_batch_tracker
+
+# Setup logging: ditulis thread QueueListener, bukan dari event loop
+setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Pub-Sub Log Aggregator", version="1.0.0")
+app = FastAPI(title="Pub-Sub Log Aggregator", version="1.0.0", default_response_class=CodecJSONResponse)
+
+# Latency endpoint hot path untuk /metrics
+app.add_middleware(metrics.MetricsMiddleware, paths=["/publish", "/publish/batch", "/events"])
 
 # Models
 class EventPayload(BaseModel):
@@ -33,59 +49,187 @@ class BatchEvents(BaseModel):
 
 # Global instances
 db = Database()
+# Request /publish yang bersamaan digabung menjadi satu bulk insert
+# Batch yang ditolak karena isi salah satu event dibelah agar hanya request itu yang gagal
+publish_coalescer = create_coalescer(db.process_events_bulk, split_on=lambda error: not is_transient_error(error))
 redis_client: Optional[redis.Redis] = None
+event_queue = None
+# Pre-check duplikat di Redis sebelum enqueue (EDGE_DEDUP_ENABLED=true)
+edge_dedup = None
+# Status per event untuk batch yang di-queue (GET /batches/{id})
+batch_tracker = None
+# High/low watermark panjang queue untuk /publish/batch
+backpressure = create_backpressure()
 start_time = datetime.now(timezone.utc)
+consumer_tasks: List[asyncio.Task] = []
+
+# Konfigurasi consumer: N pesan per tarikan, K task consumer paralel
+CONSUMER_BATCH_SIZE = max(1, int(os.getenv("CONSUMER_BATCH_SIZE", "500")))
+CONSUMER_CONCURRENCY = max(1, int(os.getenv("CONSUMER_CONCURRENCY", "4")))
+# Batch yang gagal ditulis dicoba ulang dengan backoff eksponensial sebelum dikembalikan ke queue
+CONSUMER_RETRY_ATTEMPTS = max(1, int(os.getenv("CONSUMER_RETRY_ATTEMPTS", "5")))
+CONSUMER_RETRY_BACKOFF_SECONDS = float(os.getenv("CONSUMER_RETRY_BACKOFF_SECONDS", "0.5"))
 
 @app.on_event("startup")
 async def startup_event():
     """Inisialisasi koneksi database dan Redis"""
-    global redis_client
+    global redis_client, event_queue, edge_dedup, batch_tracker
     
+    # Handler uvicorn baru terpasang setelah import (uvicorn.run), pindahkan juga ke queue
+    setup_logging()
     await db.connect()
     
     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
     redis_client = redis.from_url(redis_url, decode_responses=True)
     
-    # Start background consumer
-    asyncio.create_task(background_consumer())
+    # Backend queue: Redis list (default) atau Redis Streams dengan consumer group
+    event_queue = create_queue(redis_client)
+    await event_queue.setup()
+    edge_dedup = create_edge_dedup(redis_client, db.dedup_window_seconds)
+    batch_tracker = create_batch_tracker(redis_client)
+    
+    # Start background consumers
+    for worker_id in range(CONSUMER_CONCURRENCY):
+        consumer_tasks.append(asyncio.create_task(background_consumer(worker_id)))
     
     logger.info("Aggregator service started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup saat shutdown"""
+    for task in consumer_tasks:
+        task.cancel()
+    await asyncio.gather(*consumer_tasks, return_exceptions=True)
+    
     await db.close()
     if redis_client:
         await redis_client.close()
     logger.info("Aggregator service shutdown")
 
-async def background_consumer():
-    """Background task untuk memproses event dari Redis queue"""
+async def background_consumer(worker_id: int = 0):
+    """Background task untuk memproses event dari Redis queue per batch"""
     while True:
         try:
-            if redis_client:
-                # Ambil event dari Redis queue dengan blocking pop
-                result = await redis_client.blpop("event_queue", timeout=1)
-                if result:
-                    _, event_data = result
-                    event = json.loads(event_data)
-                    await db.process_event_idempotent(event)
+            if event_queue:
+                if edge_dedup:
+                    await record_edge_duplicates(worker_id)
+                messages = await event_queue.consume(CONSUMER_BATCH_SIZE, str(worker_id))
+                if messages:
+                    events = []
+                    # Data mentah per event (sejajar dengan events) untuk dead letter
+                    raw_messages = []
+                    for message_id, data in messages:
+                        try:
+                            events.append(decode_queue_message(data))
+                            raw_messages.append(data)
+                        except ValueError:
+                            # Pesan rusak tidak akan pernah bisa diproses; di-ack agar tidak diulang terus
+                            logger.error(f"Dropping malformed queue message {message_id}: {data[:200]}")
+                    metrics.CONSUMER_BATCH_SIZE.observe(len(messages))
+                    started = time.perf_counter()
+                    results = await write_batch(events, worker_id)
+                    if results is None:
+                        await requeue_batch(messages, events, worker_id)
+                        continue
+                    metrics.CONSUMER_BATCH_SECONDS.observe(time.perf_counter() - started)
+                    stored = [event for event, result in zip(events, results) if result is not None]
+                    rejected = [event for event, result in zip(events, results) if result is None]
+                    if rejected:
+                        # Event yang ditolak database dipindah ke dead letter; sisa batch tetap di-ack
+                        await event_queue.dead_letter(
+                            [data for data, result in zip(raw_messages, results) if result is None]
+                        )
+                        logger.error(f"Consumer {worker_id} dead-lettered {len(rejected)} rejected events")
+                    if edge_dedup:
+                        # Event kini ada di Postgres: klaim Redis dipertahankan selama TTL penuh
+                        await edge_dedup.confirm(stored)
+                        # Event yang ditolak tidak tersimpan: publisher boleh mengirim ulang versi yang benar
+                        await edge_dedup.release(rejected)
+                    if batch_tracker:
+                        await batch_tracker.record(events, results)
+                    # Ack hanya setelah batch tersimpan di Postgres (atau event dipindah ke dead letter)
+                    await event_queue.ack([message_id for message_id, _ in messages])
+                    backpressure.record_drained(len(messages))
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Background consumer error: {e}")
+            logger.error(f"Background consumer {worker_id} error: {e}")
             await asyncio.sleep(1)
 
+async def record_edge_duplicates(worker_id: int):
+    """
+    Duplikat yang dibuang pre-check Redis dicatat ke stats Postgres oleh consumer, bukan di jalur
+    /publish/batch, sehingga respons publish tidak bergantung pada database
+    """
+    count = await edge_dedup.take_dropped()
+    if not count:
+        return
+    try:
+        await db.record_duplicates(count)
+    except asyncio.CancelledError:
+        await edge_dedup.restore_dropped(count)
+        raise
+    except Exception as e:
+        logger.warning(f"Consumer {worker_id} failed to record {count} edge duplicates, will retry: {e}")
+        await edge_dedup.restore_dropped(count)
+
+async def write_batch(events: List[Dict[str, Any]], worker_id: int) -> Optional[List[Optional[bool]]]:
+    """
+    Tulis batch ke Postgres. Error sementara dicoba ulang hingga CONSUMER_RETRY_ATTEMPTS kali dengan
+    backoff eksponensial (aman karena insert idempoten); returns None jika semua percobaan gagal.
+    Event yang ditolak karena isinya diisolasi oleh process_events_isolating dan bernilai None
+    """
+    for attempt in range(CONSUMER_RETRY_ATTEMPTS):
+        try:
+            return await db.process_events_isolating(events)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt + 1 == CONSUMER_RETRY_ATTEMPTS:
+                logger.error(f"Consumer {worker_id} failed to write batch of {len(events)} events "
+                             f"after {CONSUMER_RETRY_ATTEMPTS} attempts: {e}")
+                return None
+            delay = CONSUMER_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+            logger.warning(f"Consumer {worker_id} batch write failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def requeue_batch(messages: List[Any], events: List[Dict[str, Any]], worker_id: int):
+    """
+    Batch yang tetap gagal: backend list mengembalikan pesan ke kepala queue (pesan yang sudah
+    di-pop tidak dikirim ulang Redis); backend stream cukup tidak di-ack, entry diambil alih XAUTOCLAIM
+    """
+    if event_queue.backend != "list":
+        return
+    try:
+        await event_queue.requeue([data for _, data in messages])
+        logger.warning(f"Consumer {worker_id} requeued {len(messages)} messages")
+    except Exception as e:
+        # Pesan tidak bisa dikembalikan: event ini hilang
+        logger.error(f"Consumer {worker_id} lost {len(messages)} messages, requeue failed: {e}")
+        if edge_dedup:
+            # Event tidak pernah sampai ke Postgres: retry publisher tidak boleh dibuang sebagai duplikat
+            await edge_dedup.release(events)
+        if batch_tracker:
+            await batch_tracker.record(events, None)
+        return
+    # Beri jeda agar batch yang sama tidak langsung diambil lagi saat database masih bermasalah
+    await asyncio.sleep(1)
+
 def validate_event(event: EventPayload) -> Dict[str, Any]:
     """Validasi dan normalisasi event"""
     try:
-        # Validasi timestamp ISO8601
-        datetime.fromisoformat(event.timestamp.replace('Z', '+00:00'))
+        # Validasi timestamp ISO8601, sekaligus normalisasi ke datetime UTC (di-parse sekali saja)
+        timestamp = parse_timestamp(event.timestamp)
         
         return {
             "topic": event.topic.strip(),
             "event_id": event.event_id.strip(),
-            "timestamp": event.timestamp,
+            "timestamp": timestamp,
             "source": event.source.strip(),
-            "payload": event.payload
+            # Payload diserialisasi sekali di sini lalu diteruskan sebagai teks sampai kolom JSONB
+            "payload_json": codec.dumps(event.payload),
+            # Waktu diterima (epoch mikrodetik), dibawa lewat queue untuk latency end-to-end
+            "accepted_us": time.time_ns() // 1000
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid timestamp format: {e}")
@@ -98,9 +242,10 @@ async def publish_event(event: EventPayload, background_tasks: BackgroundTasks):
     """
     try:
         validated_event = validate_event(event)
+        metrics.set_request_topic(validated_event["topic"])
         
-        # Process directly untuk immediate response
-        is_new = await db.process_event_idempotent(validated_event)
+        # Process langsung (digabung dengan request lain yang bersamaan) untuk immediate response
+        is_new = await publish_coalescer.submit(validated_event)
         
         if is_new:
             return {
@@ -133,57 +278,202 @@ async def publish_batch(batch: BatchEvents):
         validated_events = []
         for event in batch.events:
             validated_events.append(validate_event(event))
+        metrics.set_batch_topic(validated_events)
         
-        if redis_client:
-            # Push semua event ke queue dalam satu operasi
-            pipe = redis_client.pipeline()
-            for event in validated_events:
-                pipe.rpush("event_queue", json.dumps(event))
-            await pipe.execute()
+        if event_queue:
+            # Tolak (429) atau tahan publisher saat queue melewati high watermark
+            retry_after = await backpressure.admit(event_queue.length, len(validated_events))
+            if retry_after is not None:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Queue is over high watermark, retry later",
+                    headers={"Retry-After": str(retry_after)}
+                )
+            
+            # Duplikat yang sudah dikenal Redis dibuang sebelum masuk queue
+            claimed = await edge_dedup.claim(validated_events) if edge_dedup else [True] * len(validated_events)
+            to_queue = []
+            for index, (event, is_claimed) in enumerate(zip(validated_events, claimed)):
+                if is_claimed:
+                    to_queue.append(event)
+                    event['batch_index'] = index
             
-            logger.info(f"Batch of {len(validated_events)} events queued")
+            # Push semua event ke queue dalam satu operasi; klaim dilepas jika gagal di langkah mana pun
+            batch_id = None
+            try:
+                batch_id = await batch_tracker.create(claimed) if batch_tracker else None
+                if batch_id:
+                    for event in to_queue:
+                        event['batch_id'] = batch_id
+                await event_queue.enqueue([encode_queue_message(event) for event in to_queue])
+            except Exception:
+                if edge_dedup:
+                    await edge_dedup.release(to_queue)
+                if batch_id:
+                    await batch_tracker.discard(batch_id)
+                raise
+            
+            statuses = ["queued" if is_claimed else "duplicate" for is_claimed in claimed]
+            logger.debug("Batch of %d events queued, %d duplicates dropped",
+                         len(to_queue), len(validated_events) - len(to_queue))
         else:
-            # Fallback: process semua event secara langsung
-            for event in validated_events:
-                await db.process_event_idempotent(event)
+            # Fallback: process semua event secara langsung dalam satu bulk insert
+            results = await db.process_events_bulk(validated_events)
+            statuses = ["processed" if is_new else "duplicate" for is_new in results]
+            batch_id = None
         
+        duplicates = statuses.count("duplicate")
         return {
             "status": "accepted",
+            "batch_id": batch_id,
             "count": len(validated_events),
-            "message": f"Batch of {len(validated_events)} events queued for processing"
+            "queued": statuses.count("queued"),
+            "duplicates": duplicates,
+            "statuses": statuses,
+            "message": f"Batch of {len(validated_events) - duplicates} events queued for processing"
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Batch publish error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str, wait: float = 0):
+    """
+    Status per event (new / duplicate / failed / pending) batch yang di-queue lewat /publish/batch
+    wait > 0 menahan request hingga batch selesai diproses atau wait detik (maks 30) berlalu
+    """
+    if not batch_tracker:
+        raise HTTPException(status_code=404, detail="Batch tracking is disabled")
+    try:
+        status = await batch_tracker.get(batch_id, wait=min(max(wait, 0), 30))
+    except Exception as e:
+        logger.error(f"Get batch status error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found or expired")
+    return status
+
+@app.post("/publish/stream")
+async def publish_stream(request: Request):
+    """
+    Publish event dalam format NDJSON (opsional gzip/zstd) secara streaming
+    Tiap baris divalidasi dan di-flush per chunk selagi body masih diterima
+    """
+    async def flush(events: List[Dict[str, Any]]) -> Optional[List[bool]]:
+        if not event_queue:
+            return await db.process_events_bulk(events)
+        
+        retry_after = await backpressure.admit(event_queue.length, len(events))
+        if retry_after is not None:
+            raise StreamRejected(429, "Queue is over high watermark, retry later",
+                                 {"Retry-After": str(retry_after)})
+        await event_queue.enqueue([encode_queue_message(event) for event in events])
+        return None
+    
+    try:
+        result = await ingest_ndjson(
+            request,
+            lambda record: validate_event(EventPayload.model_validate(record)),
+            flush
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Stream publish error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    summary = result["summary"]
+    logger.info(f"Stream ingested: {summary['accepted']} accepted, {summary['rejected']} rejected "
+                f"from {summary['lines']} lines")
+    return CodecJSONResponse(summary, status_code=result["status_code"], headers=result["headers"])
+
 @app.get("/events")
-async def get_events(topic: Optional[str] = None, limit: int = 100):
-    """Ambil daftar event yang telah diproses"""
+async def get_events(topic: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None,
+                     time_field: str = "processed_at"):
+    """
+    Ambil daftar event yang telah diproses, terbaru dulu
+    Halaman berikutnya diambil dengan cursor=next_cursor dari respons sebelumnya
+    """
     try:
         if limit > 1000:
-            limit = 1000  # Batasi untuk performa
+            limit = 1000  # Batasi untuk performa, per halaman
         
-        events = await db.get_events(topic, limit)
+        try:
+            after = decode_cursor(cursor) if cursor else None
+            since_ts, until_ts = parse_time_range(since, until, time_field)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Convert datetime objects to ISO string
-        for event in events:
-            if 'timestamp' in event and isinstance(event['timestamp'], datetime):
-                event['timestamp'] = event['timestamp'].isoformat()
-            if 'processed_at' in event and isinstance(event['processed_at'], datetime):
-                event['processed_at'] = event['processed_at'].isoformat()
+        metrics.set_request_topic(topic)
+        events = await db.get_events(topic, limit, after=after, since=since_ts, until=until_ts,
+                                     time_field=time_field)
         
-        return {
-            "events": events,
+        # Halaman penuh berarti mungkin masih ada data berikutnya
+        next_cursor = None
+        if events and len(events) == limit:
+            next_cursor = encode_cursor(events[-1]['processed_at'], events[-1]['id'])
+        
+        # Payload JSONB disisipkan langsung ke body respons tanpa parse ulang
+        body = render_events_response(events, {
             "count": len(events),
             "topic_filter": topic,
-            "limit": limit
-        }
+            "limit": limit,
+            "next_cursor": next_cursor
+        })
+        return Response(content=body, media_type="application/json")
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get events error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/events/export")
+async def export_events(topic: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                        time_field: str = "processed_at", format: str = "ndjson"):
+    """
+    Export seluruh event yang cocok sebagai NDJSON atau CSV secara streaming
+    Dibaca lewat server-side cursor sehingga memori tetap konstan
+    """
+    try:
+        since_ts, until_ts = parse_time_range(since, until, time_field)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = db.iter_events(topic, since=since_ts, until=until_ts, time_field=time_field)
+    return StreamingResponse(
+        render_export(rows, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'}
+    )
+
+@app.get("/topics")
+async def get_topics():
+    """Ambil registry topic beserta first/last seen dan jumlah event"""
+    try:
+        topics = await db.get_topics()
+        
+        # Convert datetime objects to ISO string
+        for topic in topics:
+            for field in ('first_seen', 'last_seen'):
+                if isinstance(topic.get(field), datetime):
+                    topic[field] = topic[field].isoformat()
+        
+        return {
+            "topics": topics,
+            "count": len(topics)
+        }
+    
+    except Exception as e:
+        logger.error(f"Get topics error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/stats")
 async def get_stats():
     """Ambil statistik sistem"""
@@ -198,11 +488,25 @@ async def get_stats():
         uptime_seconds = (datetime.now(timezone.utc) - start_time).total_seconds()
         stats['uptime_seconds'] = int(uptime_seconds)
         
+        # Statistik pre-filter duplikat in-process
+        stats['dedup_cache'] = db.dedup_cache.stats()
+        stats['dedup_key'] = db.dedup_key
+        if db.dedup_window_seconds:
+            stats['dedup_window'] = {'seconds': db.dedup_window_seconds, 'keys_purged': db.keys_purged}
+        if db.partitioned:
+            stats['partitions'] = await db.get_partitions()
+        stats['read_replica'] = db.read_replica.stats() if db.read_replica else {"enabled": False}
+        stats['db_pool'] = db.pool_stats()
+        stats['publish_coalescer'] = publish_coalescer.stats()
+        stats['backpressure'] = backpressure.stats()
+        stats['edge_dedup'] = edge_dedup.stats() if edge_dedup else {"enabled": False}
+        
         # Tambah queue info jika Redis tersedia
-        if redis_client:
+        if event_queue:
             try:
-                queue_length = await redis_client.llen("event_queue")
-                stats['queue_length'] = queue_length
+                queue_info = await event_queue.info()
+                stats['queue_length'] = queue_info['length']
+                stats['queue'] = queue_info
             except:
                 stats['queue_length'] = 0
         else:
@@ -214,12 +518,36 @@ async def get_stats():
         logger.error(f"Get stats error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics():
+    """Metrik format Prometheus: latency endpoint, pool/query database, consumer dan queue"""
+    db.pool_stats()
+    if event_queue:
+        try:
+            queue_info = await event_queue.info()
+            metrics.QUEUE_DEPTH.set(queue_info['length'], queue_info['backend'])
+            if queue_info.get('pending') is not None:
+                metrics.QUEUE_PENDING.set(queue_info['pending'], queue_info['backend'])
+            if queue_info.get('lag') is not None:
+                metrics.QUEUE_LAG.set(queue_info['lag'], queue_info['backend'])
+        except Exception as e:
+            logger.error(f"Queue metrics error: {e}")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/stats/latency")
+async def get_latency_stats(topic: Optional[str] = None):
+    """
+    Latency end-to-end per topic hingga event ter-commit di processed_events:
+    'accept' sejak diterima API, 'event' sejak timestamp event (p50/p95/p99 dalam ms)
+    """
+    return latency_tracker.snapshot(topic)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        # Test database connection
-        await db.get_stats()
+        # Test koneksi primary; replica yang down tidak membuat service unhealthy (baca jatuh ke primary)
+        await db.ping()
         
         # Test Redis connection
         redis_status = "connected"
@@ -234,6 +562,7 @@ async def health_check():
         return {
             "status": "healthy",
             "database": "connected",
+            "read_replica": db.read_replica.status if db.read_replica else "not_configured",
             "redis": redis_status,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
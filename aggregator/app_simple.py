@@ -1,27 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 from contextlib import asynccontextmanager
 import logging
+import time
 from datetime import datetime, timezone
-import json
 
-from database import Database
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+import codec
+import metrics
+from logging_config import setup_logging
+from latency import tracker as latency_tracker
+from codec import CodecJSONResponse
+from database import Database, is_transient_error
+from events import (
+    parse_timestamp, parse_time_range, render_events_response, render_export, EXPORT_FORMATS,
+    encode_cursor, decode_cursor
 )
+from coalescer import create_coalescer
+from stream_ingest import ingest_ndjson
+
+# Setup logging: ditulis thread QueueListener, bukan dari event loop
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Global instances
 db = Database()
+# Request /publish yang bersamaan digabung menjadi satu bulk insert
+# Batch yang ditolak karena isi salah satu event dibelah agar hanya request itu yang gagal
+publish_coalescer = create_coalescer(db.process_events_bulk, split_on=lambda error: not is_transient_error(error))
 start_time = datetime.now(timezone.utc)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup; handler uvicorn baru terpasang setelah import (uvicorn.run), pindahkan juga ke queue
+    setup_logging()
     await db.connect()
     logger.info("Aggregator service started successfully")
     yield
@@ -29,7 +42,10 @@ async def lifespan(app: FastAPI):
     await db.close()
     logger.info("Aggregator service shutdown")
 
-app = FastAPI(title="Pub-Sub Log Aggregator", version="1.0.0", lifespan=lifespan)
+app = FastAPI(title="Pub-Sub Log Aggregator", version="1.0.0", default_response_class=CodecJSONResponse, lifespan=lifespan)
+
+# Latency endpoint hot path untuk /metrics
+app.add_middleware(metrics.MetricsMiddleware, paths=["/publish", "/publish/batch", "/events"])
 
 # Models
 class EventPayload(BaseModel):
@@ -45,15 +61,18 @@ class BatchEvents(BaseModel):
 def validate_event(event: EventPayload) -> Dict[str, Any]:
     """Validasi dan normalisasi event"""
     try:
-        # Validasi timestamp ISO8601
-        datetime.fromisoformat(event.timestamp.replace('Z', '+00:00'))
+        # Validasi timestamp ISO8601, sekaligus normalisasi ke datetime UTC (di-parse sekali saja)
+        timestamp = parse_timestamp(event.timestamp)
         
         return {
             "topic": event.topic.strip(),
             "event_id": event.event_id.strip(),
-            "timestamp": event.timestamp,
+            "timestamp": timestamp,
             "source": event.source.strip(),
-            "payload": event.payload
+            # Payload diserialisasi sekali di sini lalu diteruskan sebagai teks sampai kolom JSONB
+            "payload_json": codec.dumps(event.payload),
+            # Waktu diterima (epoch mikrodetik), dibawa lewat queue untuk latency end-to-end
+            "accepted_us": time.time_ns() // 1000
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid timestamp format: {e}")
@@ -66,16 +85,13 @@ async def publish_event(event: EventPayload):
     """
     try:
         validated_event = validate_event(event)
+        metrics.set_request_topic(validated_event["topic"])
         
-        # Process directly
-        processed = await db.process_event_idempotent(validated_event)
+        # Process langsung, digabung dengan request lain yang bersamaan
+        processed = await publish_coalescer.submit(validated_event)
         
-        if processed:
-            logger.info(f"Event processed: {validated_event['topic']}/{validated_event['event_id']}")
-            message = "Event processed successfully"
-        else:
-            logger.info(f"Duplicate event dropped: {validated_event['topic']}/{validated_event['event_id']}")
-            message = "Duplicate event dropped"
+        # Hasil per event sudah dicatat (sampling + ringkasan) di Database
+        message = "Event processed successfully" if processed else "Duplicate event dropped"
         
         return {
             "status": "accepted",
@@ -98,19 +114,12 @@ async def publish_batch(batch: BatchEvents):
         validated_events = []
         for event in batch.events:
             validated_events.append(validate_event(event))
+        metrics.set_batch_topic(validated_events)
         
-        processed_count = 0
-        duplicate_count = 0
-        
-        # Process each event
-        for event in validated_events:
-            processed = await db.process_event_idempotent(event)
-            if processed:
-                processed_count += 1
-            else:
-                duplicate_count += 1
-        
-        logger.info(f"Batch processed: {processed_count} new, {duplicate_count} duplicates")
+        # Process seluruh batch dalam satu bulk insert
+        results = await db.process_events_bulk(validated_events)
+        processed_count = sum(results)
+        duplicate_count = len(results) - processed_count
         
         return {
             "status": "accepted",
@@ -124,33 +133,113 @@ async def publish_batch(batch: BatchEvents):
         logger.error(f"Batch publish error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/publish/stream")
+async def publish_stream(request: Request):
+    """
+    Publish event dalam format NDJSON (opsional gzip/zstd) secara streaming
+    Tiap baris divalidasi dan di-flush per chunk selagi body masih diterima
+    """
+    try:
+        result = await ingest_ndjson(
+            request,
+            lambda record: validate_event(EventPayload.model_validate(record)),
+            db.process_events_bulk
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Stream publish error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    summary = result["summary"]
+    logger.info(f"Stream ingested: {summary['accepted']} accepted, {summary['rejected']} rejected "
+                f"from {summary['lines']} lines")
+    return CodecJSONResponse(summary, status_code=result["status_code"], headers=result["headers"])
+
 @app.get("/events")
-async def get_events(topic: Optional[str] = None, limit: int = 100):
-    """Ambil daftar event yang telah diproses"""
+async def get_events(topic: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None,
+                     time_field: str = "processed_at"):
+    """
+    Ambil daftar event yang telah diproses, terbaru dulu
+    Halaman berikutnya diambil dengan cursor=next_cursor dari respons sebelumnya
+    """
     try:
         if limit > 1000:
-            limit = 1000  # Batasi untuk performa
+            limit = 1000  # Batasi untuk performa, per halaman
         
-        events = await db.get_events(topic, limit)
+        try:
+            after = decode_cursor(cursor) if cursor else None
+            since_ts, until_ts = parse_time_range(since, until, time_field)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Convert datetime objects to ISO string
-        for event in events:
-            if 'timestamp' in event and isinstance(event['timestamp'], datetime):
-                event['timestamp'] = event['timestamp'].isoformat()
-            if 'processed_at' in event and isinstance(event['processed_at'], datetime):
-                event['processed_at'] = event['processed_at'].isoformat()
+        metrics.set_request_topic(topic)
+        events = await db.get_events(topic, limit, after=after, since=since_ts, until=until_ts,
+                                     time_field=time_field)
         
-        return {
-            "events": events,
+        # Halaman penuh berarti mungkin masih ada data berikutnya
+        next_cursor = None
+        if events and len(events) == limit:
+            next_cursor = encode_cursor(events[-1]['processed_at'], events[-1]['id'])
+        
+        # Payload JSONB disisipkan langsung ke body respons tanpa parse ulang
+        body = render_events_response(events, {
             "count": len(events),
             "topic_filter": topic,
-            "limit": limit
-        }
+            "limit": limit,
+            "next_cursor": next_cursor
+        })
+        return Response(content=body, media_type="application/json")
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get events error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/events/export")
+async def export_events(topic: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                        time_field: str = "processed_at", format: str = "ndjson"):
+    """
+    Export seluruh event yang cocok sebagai NDJSON atau CSV secara streaming
+    Dibaca lewat server-side cursor sehingga memori tetap konstan
+    """
+    try:
+        since_ts, until_ts = parse_time_range(since, until, time_field)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = db.iter_events(topic, since=since_ts, until=until_ts, time_field=time_field)
+    return StreamingResponse(
+        render_export(rows, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'}
+    )
+
+@app.get("/topics")
+async def get_topics():
+    """Ambil registry topic beserta first/last seen dan jumlah event"""
+    try:
+        topics = await db.get_topics()
+        
+        # Convert datetime objects to ISO string
+        for topic in topics:
+            for field in ('first_seen', 'last_seen'):
+                if isinstance(topic.get(field), datetime):
+                    topic[field] = topic[field].isoformat()
+        
+        return {
+            "topics": topics,
+            "count": len(topics)
+        }
+    
+    except Exception as e:
+        logger.error(f"Get topics error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/stats")
 async def get_stats():
     """Ambil statistik sistem"""
@@ -165,6 +254,17 @@ async def get_stats():
         uptime_seconds = (datetime.now(timezone.utc) - start_time).total_seconds()
         stats['uptime_seconds'] = int(uptime_seconds)
         
+        # Statistik pre-filter duplikat in-process
+        stats['dedup_cache'] = db.dedup_cache.stats()
+        stats['dedup_key'] = db.dedup_key
+        if db.dedup_window_seconds:
+            stats['dedup_window'] = {'seconds': db.dedup_window_seconds, 'keys_purged': db.keys_purged}
+        if db.partitioned:
+            stats['partitions'] = await db.get_partitions()
+        stats['read_replica'] = db.read_replica.stats() if db.read_replica else {"enabled": False}
+        stats['db_pool'] = db.pool_stats()
+        stats['publish_coalescer'] = publish_coalescer.stats()
+        
         # No queue in simple version
         stats['queue_length'] = 0
         
@@ -174,16 +274,31 @@ async def get_stats():
         logger.error(f"Get stats error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics():
+    """Metrik format Prometheus: latency endpoint dan pool/query database"""
+    db.pool_stats()
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/stats/latency")
+async def get_latency_stats(topic: Optional[str] = None):
+    """
+    Latency end-to-end per topic hingga event ter-commit di processed_events:
+    'accept' sejak diterima API, 'event' sejak timestamp event (p50/p95/p99 dalam ms)
+    """
+    return latency_tracker.snapshot(topic)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        # Test database connection
-        await db.get_stats()
+        # Test koneksi primary; replica yang down tidak membuat service unhealthy (baca jatuh ke primary)
+        await db.ping()
         
         return {
             "status": "healthy",
             "database": "connected",
+            "read_replica": db.read_replica.status if db.read_replica else "not_configured",
             "redis": "not_used",
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
@@ -0,0 +1,102 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+class QueueBackpressure:
+    """
+    Backpressure berbasis panjang queue dengan high/low watermark (hysteresis)
+    Di atas high watermark publisher ditolak (429 + Retry-After) atau ditahan hingga
+    deadline; status throttled baru dilepas setelah queue turun ke low watermark
+    """
+
+    def __init__(self, high_watermark: int = 50000, low_watermark: int = 25000, mode: str = "reject",
+                 block_timeout: float = 5.0, rate_window: float = 10.0):
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.mode = mode
+        self.block_timeout = block_timeout
+        self.rate_window = rate_window
+        self.throttled = False
+        self.last_length = 0
+        self.rejected_batches = 0
+        self.rejected_events = 0
+        self._drained: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.high_watermark > 0
+
+    def record_drained(self, count: int):
+        """Dipanggil consumer setiap selesai menulis batch ke database"""
+        now = time.monotonic()
+        self._drained.append((now, count))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self._drained and now - self._drained[0][0] > self.rate_window:
+            self._drained.popleft()
+
+    def drain_rate(self) -> float:
+        """Rata-rata event/detik yang dikeluarkan consumer dalam rate_window terakhir"""
+        self._trim(time.monotonic())
+        return sum(count for _, count in self._drained) / self.rate_window
+
+    def retry_after(self) -> int:
+        """Perkiraan detik hingga queue turun ke low watermark, dibatasi 1..60"""
+        rate = self.drain_rate()
+        backlog = max(self.last_length - self.low_watermark, 0)
+        if rate <= 0:
+            return 60
+        return max(1, min(60, math.ceil(backlog / rate)))
+
+    def _update(self, length: int) -> bool:
+        self.last_length = length
+        if length >= self.high_watermark:
+            self.throttled = True
+        elif length <= self.low_watermark:
+            self.throttled = False
+        return self.throttled
+
+    async def admit(self, queue_length: Callable[[], Awaitable[int]], batch_size: int) -> Optional[int]:
+        """
+        Cek apakah batch boleh masuk queue
+        Returns None jika diterima, atau nilai Retry-After (detik) jika harus ditolak
+        """
+        if not self.enabled or not self._update(await queue_length()):
+            return None
+
+        if self.mode == "block":
+            deadline = time.monotonic() + self.block_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                if not self._update(await queue_length()):
+                    return None
+
+        self.rejected_batches += 1
+        self.rejected_events += batch_size
+        return self.retry_after()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "state": "throttled" if self.throttled else "open",
+            "mode": self.mode,
+            "high_watermark": self.high_watermark,
+            "low_watermark": self.low_watermark,
+            "last_queue_length": self.last_length,
+            "drain_rate": round(self.drain_rate(), 2),
+            "rejected_batches": self.rejected_batches,
+            "rejected_events": self.rejected_events
+        }
+
+def create_backpressure() -> QueueBackpressure:
+    """Buat backpressure dari konfigurasi environment; QUEUE_HIGH_WATERMARK=0 untuk menonaktifkan"""
+    return QueueBackpressure(
+        high_watermark=int(os.getenv("QUEUE_HIGH_WATERMARK", "50000")),
+        low_watermark=int(os.getenv("QUEUE_LOW_WATERMARK", "25000")),
+        mode=os.getenv("BACKPRESSURE_MODE", "reject").lower(),
+        block_timeout=float(os.getenv("BACKPRESSURE_BLOCK_TIMEOUT_SECONDS", "5"))
+    )
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Satu karakter per event di string outcome Redis
+PENDING = "."
+OUTCOMES = {
+    "n": "new",
+    "d": "duplicate",
+    "f": "failed",
+    PENDING: "pending"
+}
+
+# KEYS berpasangan (outcomes, pending) per event, ARGV berpasangan (index, outcome).
+# Hanya posisi yang masih pending yang diubah, jadi pesan yang dikirim ulang (Redis Streams)
+# tidak mengurangi counter dua kali. Saat counter habis, pemanggil long-poll diberi tahu
+RECORD_SCRIPT = """
+for i = 1, #KEYS, 2 do
+    local index = tonumber(ARGV[i])
+    if redis.call('EXISTS', KEYS[i]) == 1 and redis.call('GETRANGE', KEYS[i], index, index) == '.' then
+        redis.call('SETRANGE', KEYS[i], index, ARGV[i + 1])
+        if redis.call('DECR', KEYS[i + 1]) <= 0 then
+            redis.call('PUBLISH', KEYS[i] .. ':done', '1')
+        end
+    end
+end
+return 0
+"""
+
+class BatchTracker:
+    """
+    Status per event untuk batch yang di-queue: outcome disimpan ringkas di Redis
+    (satu karakter per event) dengan TTL, diisi consumer setelah batch tersimpan di Postgres
+    """
+
+    def __init__(self, client: redis.Redis, ttl_seconds: int = 3600, prefix: str = "batch:"):
+        self.client = client
+        self.ttl_seconds = max(1, ttl_seconds)
+        self.prefix = prefix
+        self._record = client.register_script(RECORD_SCRIPT)
+
+    def _outcomes_key(self, batch_id: str) -> str:
+        return f"{self.prefix}{batch_id}"
+
+    def _pending_key(self, batch_id: str) -> str:
+        return f"{self.prefix}{batch_id}:pending"
+
+    async def create(self, queued: List[bool]) -> str:
+        """
+        Daftarkan batch baru sebelum enqueue; queued sejajar dengan event batch, False berarti
+        event sudah dibuang sebagai duplikat sebelum masuk queue. Returns batch_id
+        """
+        batch_id = uuid.uuid4().hex
+        outcomes = "".join(PENDING if is_queued else "d" for is_queued in queued)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._outcomes_key(batch_id), outcomes, ex=self.ttl_seconds)
+        pipe.set(self._pending_key(batch_id), sum(queued), ex=self.ttl_seconds)
+        await pipe.execute()
+        return batch_id
+
+    async def discard(self, batch_id: str):
+        """Hapus batch yang gagal di-enqueue"""
+        await self.client.delete(self._outcomes_key(batch_id), self._pending_key(batch_id))
+
+    async def record(self, events: List[Dict[str, Any]], results: Optional[List[Optional[bool]]]):
+        """
+        Catat outcome event hasil consumer; results None berarti batch gagal dan tidak akan diulang,
+        elemen None berarti event itu ditolak database. Event tanpa batch_id (mis. dari /publish/stream) dilewati
+        """
+        keys: List[str] = []
+        args: List[Any] = []
+        for position, event in enumerate(events):
+            batch_id = event.get('batch_id')
+            if batch_id is None:
+                continue
+            if results is None or results[position] is None:
+                outcome = "f"
+            else:
+                outcome = "n" if results[position] else "d"
+            keys.extend((self._outcomes_key(batch_id), self._pending_key(batch_id)))
+            args.extend((event['batch_index'], outcome))
+        if keys:
+            await self._record(keys=keys, args=args)
+
+    async def get(self, batch_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Ambil status batch; None jika tidak dikenal atau sudah kedaluwarsa.
+        wait > 0: long-poll hingga semua event selesai atau wait detik berlalu
+        """
+        outcomes = await self.client.get(self._outcomes_key(batch_id))
+        if outcomes is None or wait <= 0 or PENDING not in outcomes:
+            return self._render(batch_id, outcomes)
+
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(f"{self._outcomes_key(batch_id)}:done")
+            deadline = time.monotonic() + wait
+            # Cek ulang setelah subscribe agar notifikasi yang terkirim sebelumnya tidak terlewat
+            outcomes = await self.client.get(self._outcomes_key(batch_id))
+            while outcomes is not None and PENDING in outcomes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+                if message is None:
+                    # get_message bisa kembali lebih awal tanpa pesan
+                    await asyncio.sleep(min(0.05, max(remaining, 0)))
+                    continue
+                outcomes = await self.client.get(self._outcomes_key(batch_id))
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+        return self._render(batch_id, outcomes)
+
+    @staticmethod
+    def _render(batch_id: str, outcomes: Optional[str]) -> Optional[Dict[str, Any]]:
+        if outcomes is None:
+            return None
+        counts = {name: outcomes.count(code) for code, name in OUTCOMES.items()}
+        return {
+            "batch_id": batch_id,
+            "status": "pending" if counts["pending"] else "complete",
+            "total": len(outcomes),
+            **counts,
+            "outcomes": [OUTCOMES[code] for code in outcomes]
+        }
+
+def create_batch_tracker(client: redis.Redis) -> Optional[BatchTracker]:
+    """Tracking status batch aktif kecuali BATCH_TRACKING_ENABLED=false"""
+    if os.getenv("BATCH_TRACKING_ENABLED", "true").lower() != "true":
+        return None
+    return BatchTracker(client, ttl_seconds=int(os.getenv("BATCH_STATUS_TTL_SECONDS", "3600")))
@@ -0,0 +1,109 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+ProcessBatch = Callable[[List[Dict[str, Any]]], Awaitable[List[bool]]]
+
+class EventCoalescer:
+    """
+    Menggabungkan request /publish yang datang bersamaan menjadi satu bulk insert
+    Tanpa flush yang sedang berjalan, event langsung di-flush (tanpa tambahan latency);
+    saat database sibuk, event menunggu hingga max_wait_ms atau max_batch event terkumpul.
+    Tiap pemanggil menerima hasil new/duplicate miliknya sendiri. Jika batch gabungan gagal dan
+    split_on(error) True, batch dibelah dua secara rekursif sehingga hanya pemanggil dengan event
+    bermasalah yang menerima error; error lain (mis. database mati) diteruskan ke semua pemanggil
+    """
+
+    def __init__(self, process_batch: ProcessBatch, max_batch: int = 200,
+                 max_wait_ms: float = 2.0, max_in_flight: int = 4,
+                 split_on: Optional[Callable[[Exception], bool]] = None):
+        self.process_batch = process_batch
+        self.split_on = split_on or (lambda error: True)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max(1, max_in_flight)
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.events = 0
+        self.max_batch_seen = 0
+        self.splits = 0
+
+    async def submit(self, event: Dict[str, Any]) -> bool:
+        """Antrikan event dan tunggu hasilnya: True jika baru, False jika duplikat"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((event, future))
+
+        if self._in_flight == 0 or len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Slot penuh: flush yang sedang berjalan akan mengambil sisa pending saat selesai
+        while self._pending and self._in_flight < self.max_in_flight:
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            self._in_flight += 1
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, events: List[Dict[str, Any]]) -> List[Any]:
+        """Hasil per event: bool, atau exception untuk event yang gagal"""
+        try:
+            return list(await self.process_batch(events))
+        except Exception as e:
+            if len(events) == 1 or not self.split_on(e):
+                return [e] * len(events)
+            self.splits += 1
+            middle = len(events) // 2
+            return await self._process(events[:middle]) + await self._process(events[middle:])
+
+    async def _run(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        try:
+            results = await self._process([event for event, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            self.batches += 1
+            self.events += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            if self._pending:
+                self._flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "avg_batch_size": round(self.events / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "splits": self.splits,
+            "pending": len(self._pending),
+            "in_flight": self._in_flight
+        }
+
+def create_coalescer(process_batch: ProcessBatch,
+                     split_on: Optional[Callable[[Exception], bool]] = None) -> EventCoalescer:
+    """Buat coalescer /publish dari konfigurasi environment"""
+    return EventCoalescer(
+        process_batch,
+        split_on=split_on,
+        max_batch=int(os.getenv("PUBLISH_COALESCE_MAX_BATCH", "200")),
+        max_wait_ms=float(os.getenv("PUBLISH_COALESCE_MAX_WAIT_MS", "2")),
+        max_in_flight=int(os.getenv("PUBLISH_COALESCE_MAX_IN_FLIGHT", "4"))
+    )
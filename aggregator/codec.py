@@ -0,0 +1,90 @@
+"""
+Codec JSON tunggal untuk respons HTTP, pesan queue Redis dan payload database
+Memakai orjson atau msgspec jika terpasang, dengan fallback ke stdlib json.
+Backend bisa dipaksa lewat JSON_CODEC=orjson|msgspec|json
+"""
+import json
+import logging
+import os
+from typing import Any, Callable, Dict
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+def _stdlib_codec() -> Dict[str, Callable]:
+    return {
+        "dumps": json.dumps,
+        "dumps_bytes": lambda obj: json.dumps(obj, ensure_ascii=False).encode(),
+        "loads": json.loads
+    }
+
+def _with_fallback(fast: Callable[[Any], Any], slow: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """
+    Encoder cepat dengan fallback ke stdlib untuk nilai yang tidak didukungnya, mis. integer
+    di luar 64 bit (orjson: JSONEncodeError, subclass TypeError; msgspec: OverflowError)
+    """
+    def encode(obj: Any):
+        try:
+            return fast(obj)
+        except (TypeError, OverflowError):
+            return slow(obj)
+    return encode
+
+def _orjson_codec() -> Dict[str, Callable]:
+    import orjson
+    stdlib = _stdlib_codec()
+    return {
+        "dumps": _with_fallback(lambda obj: orjson.dumps(obj).decode(), stdlib["dumps"]),
+        "dumps_bytes": _with_fallback(orjson.dumps, stdlib["dumps_bytes"]),
+        "loads": orjson.loads
+    }
+
+def _msgspec_codec() -> Dict[str, Callable]:
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    stdlib = _stdlib_codec()
+    return {
+        "dumps": _with_fallback(lambda obj: encoder.encode(obj).decode(), stdlib["dumps"]),
+        "dumps_bytes": _with_fallback(encoder.encode, stdlib["dumps_bytes"]),
+        "loads": msgspec.json.decode
+    }
+
+CODECS = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "json": _stdlib_codec
+}
+
+backend = "json"
+dumps: Callable[[Any], str] = json.dumps
+dumps_bytes: Callable[[Any], bytes] = _stdlib_codec()["dumps_bytes"]
+loads: Callable[[Any], Any] = json.loads
+
+def set_backend(name: str):
+    """Ganti backend codec; ImportError jika library tidak terpasang"""
+    global backend, dumps, dumps_bytes, loads
+    functions = CODECS[name]()
+    backend = name
+    dumps = functions["dumps"]
+    dumps_bytes = functions["dumps_bytes"]
+    loads = functions["loads"]
+
+def _select_default():
+    preferred = os.getenv("JSON_CODEC")
+    for name in ([preferred] if preferred else ["orjson", "msgspec", "json"]):
+        try:
+            set_backend(name)
+            return
+        except (ImportError, KeyError):
+            if preferred:
+                logger.warning(f"JSON codec {name} not available, falling back")
+    set_backend("json")
+
+_select_default()
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse yang merender body dengan codec aktif"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Optional
+
+class DedupCache:
+    """
+    Cache in-process untuk key (topic, event_id) yang sudah tercatat di database
+    Bounded dengan eviction LRU dan TTL opsional. Database tetap source of truth;
+    cache hanya dipakai untuk memotong round trip duplikat yang sudah dikenal
+    """
+
+    def __init__(self, max_size: int = 100000, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def contains(self, key: Hashable) -> bool:
+        """Cek apakah key dikenal; hit menyegarkan posisi LRU"""
+        if not self.enabled:
+            return False
+
+        seen_at = self._entries.get(key)
+        if seen_at is None:
+            self.misses += 1
+            return False
+
+        if self.ttl_seconds is not None and time.monotonic() - seen_at > self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return False
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True
+
+    def add(self, key: Hashable):
+        """Catat key yang sudah pasti ada di database"""
+        if not self.enabled:
+            return
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self._entries[key] = time.monotonic()
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
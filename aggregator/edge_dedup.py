@@ -0,0 +1,124 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as redis
+
+from events import event_key_digest
+
+logger = logging.getLogger(__name__)
+
+# SET NX EX per key secara berurutan dalam satu round trip atomik; duplikat dalam batch
+# yang sama otomatis terdeteksi karena kemunculan pertama sudah meng-set key.
+# KEYS[1] adalah counter duplikat yang dibuang, dicatat ke Postgres oleh consumer
+CLAIM_SCRIPT = """
+local claimed = {}
+local dropped = 0
+for i = 2, #KEYS do
+    if redis.call('SET', KEYS[i], '1', 'NX', 'EX', ARGV[1]) then
+        claimed[i - 1] = 1
+    else
+        claimed[i - 1] = 0
+        dropped = dropped + 1
+    end
+end
+if dropped > 0 then
+    redis.call('INCRBY', KEYS[1], dropped)
+end
+return claimed
+"""
+
+class RedisDedup:
+    """
+    Pre-check duplikat di Redis sebelum enqueue: tiap (topic, event_id) diklaim dengan
+    SET NX EX. Hanya memotong duplikat yang sudah dikenal; Postgres tetap source of truth
+    untuk key yang sudah kedaluwarsa atau hilang dari Redis.
+    Klaim awal hanya berlaku pending_ttl_seconds; TTL penuh dipasang consumer lewat confirm()
+    setelah event ter-commit, sehingga event yang tidak pernah sampai ke Postgres tidak
+    memblokir retry publisher selama TTL penuh
+    """
+
+    def __init__(self, client: redis.Redis, ttl_seconds: int = 3600, prefix: str = "dedup:",
+                 pending_ttl_seconds: int = 60):
+        self.client = client
+        self.ttl_seconds = max(1, ttl_seconds)
+        self.pending_ttl_seconds = max(1, min(pending_ttl_seconds, self.ttl_seconds))
+        self.prefix = prefix
+        self.dropped_key = f"{prefix}dropped"
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self.checked = 0
+        self.duplicates_dropped = 0
+        self.released = 0
+        self.confirmed = 0
+
+    def _key(self, event: Dict[str, Any]) -> str:
+        # Digest 16 byte: panjang key tetap berapa pun panjang topic / event_id
+        return f"{self.prefix}{event_key_digest(event).hex()}"
+
+    async def claim(self, events: List[Dict[str, Any]]) -> List[bool]:
+        """Returns list bool sejajar dengan input: True jika baru diklaim, False jika duplikat"""
+        if not events:
+            return []
+        keys = [self.dropped_key] + [self._key(event) for event in events]
+        claimed = await self._claim(keys=keys, args=[self.pending_ttl_seconds])
+        results = [bool(value) for value in claimed]
+        self.checked += len(results)
+        self.duplicates_dropped += len(results) - sum(results)
+        return results
+
+    async def confirm(self, events: List[Dict[str, Any]]):
+        """
+        Pasang key dengan TTL penuh untuk event yang sudah tersimpan di Postgres (baru atau duplikat).
+        SET, bukan EXPIRE: klaim yang sudah kedaluwarsa selama event menunggu di queue tetap dipasang ulang
+        """
+        if not events:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for event in events:
+            pipe.set(self._key(event), "1", ex=self.ttl_seconds)
+        await pipe.execute()
+        self.confirmed += len(events)
+
+    async def release(self, events: List[Dict[str, Any]]):
+        """Lepas klaim event yang gagal di-enqueue atau ditulis agar retry publisher tidak dianggap duplikat"""
+        if not events:
+            return
+        await self.client.delete(*[self._key(event) for event in events])
+        self.released += len(events)
+
+    async def take_dropped(self) -> int:
+        """Ambil dan reset counter duplikat yang dibuang claim() di semua replika"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self.dropped_key)
+        pipe.delete(self.dropped_key)
+        value, _ = await pipe.execute()
+        return int(value or 0)
+
+    async def restore_dropped(self, count: int):
+        """Kembalikan counter yang gagal dicatat agar diambil lagi pada giliran berikutnya"""
+        if count:
+            await self.client.incrby(self.dropped_key, count)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "ttl_seconds": self.ttl_seconds,
+            "pending_ttl_seconds": self.pending_ttl_seconds,
+            "checked": self.checked,
+            "duplicates_dropped": self.duplicates_dropped,
+            "released": self.released,
+            "confirmed": self.confirmed
+        }
+
+def create_edge_dedup(client: redis.Redis, dedup_window_seconds: int = 0) -> Optional[RedisDedup]:
+    """Aktifkan pre-check Redis dengan EDGE_DEDUP_ENABLED=true; TTL tidak melebihi window dedup database"""
+    if os.getenv("EDGE_DEDUP_ENABLED", "false").lower() != "true":
+        return None
+    ttl_seconds = int(os.getenv("EDGE_DEDUP_TTL_SECONDS", "3600"))
+    if dedup_window_seconds:
+        ttl_seconds = min(ttl_seconds, dedup_window_seconds)
+    return RedisDedup(
+        client,
+        ttl_seconds=ttl_seconds,
+        pending_ttl_seconds=int(os.getenv("EDGE_DEDUP_PENDING_TTL_SECONDS", "60"))
+    )
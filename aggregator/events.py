@@ -0,0 +1,178 @@
+import base64
+import csv
+import hashlib
+import io
+
+import codec
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+UTC_SUFFIXES = ('Z', '+00:00')
+
+def parse_timestamp(timestamp_str: str) -> datetime:
+    """Parse timestamp ISO8601 ke datetime UTC naive untuk kolom TIMESTAMP"""
+    # Fast path: timestamp UTC cukup dibuang suffix-nya, tanpa konversi timezone
+    for suffix in UTC_SUFFIXES:
+        if timestamp_str.endswith(suffix):
+            parsed_timestamp = datetime.fromisoformat(timestamp_str[:-len(suffix)])
+            if parsed_timestamp.tzinfo is None:
+                return parsed_timestamp
+
+    parsed_timestamp = datetime.fromisoformat(timestamp_str)
+    # Convert to UTC if timezone aware
+    if parsed_timestamp.tzinfo is not None:
+        parsed_timestamp = parsed_timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed_timestamp
+
+def parse_time_range(since: Optional[str], until: Optional[str],
+                     time_field: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Validasi filter waktu query event; ValueError jika tidak valid"""
+    if time_field not in ('processed_at', 'timestamp'):
+        raise ValueError("time_field must be 'processed_at' or 'timestamp'")
+    return (parse_timestamp(since) if since else None,
+            parse_timestamp(until) if until else None)
+
+def to_epoch_us(timestamp: datetime) -> int:
+    """Datetime UTC naive ke epoch mikrodetik"""
+    return (timestamp - EPOCH) // MICROSECOND
+
+def from_epoch_us(epoch_us: int) -> datetime:
+    """Epoch mikrodetik ke datetime UTC naive"""
+    seconds, microseconds = divmod(epoch_us, 1000000)
+    return EPOCH + timedelta(0, seconds, microseconds)
+
+# Batas kolom BIGSERIAL id; cursor di luar rentang ini ditolak sebelum sampai ke query
+MAX_BIGINT = 2 ** 63 - 1
+
+def encode_cursor(processed_at: datetime, row_id: int) -> str:
+    """Cursor opaque untuk keyset pagination /events dari (processed_at, id)"""
+    raw = f"{to_epoch_us(processed_at)}:{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Kebalikan encode_cursor; ValueError jika cursor tidak valid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        epoch_us, row_id = raw.split(':')
+        row_id = int(row_id)
+        if not 0 <= row_id <= MAX_BIGINT:
+            raise ValueError("row id out of range")
+        return from_epoch_us(int(epoch_us)), row_id
+    except (ValueError, OverflowError) as e:
+        # OverflowError: epoch di luar rentang datetime
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def event_epoch_us(event: Dict[str, Any]) -> int:
+    """Timestamp event sebagai epoch mikrodetik; string hanya di-parse untuk pesan format lama"""
+    if 'ts_us' in event:
+        return event['ts_us']
+    timestamp = event['timestamp']
+    if not isinstance(timestamp, datetime):
+        timestamp = parse_timestamp(timestamp)
+    return to_epoch_us(timestamp)
+
+def key_digest(topic: str, event_id: str) -> bytes:
+    """
+    Digest 16 byte dari (topic, event_id) untuk DEDUP_KEY=digest: SHA-256 dipotong 128 bit.
+    Sama dengan ekspresi SQL di Database.DIGEST_SQL agar backfill dari data lama cocok
+    """
+    return hashlib.sha256(f"{topic}\x00{event_id}".encode()).digest()[:16]
+
+def event_key_digest(event: Dict[str, Any]) -> bytes:
+    """Digest key event, dihitung sekali lalu disimpan di event['key_digest']"""
+    digest = event.get('key_digest')
+    if digest is None:
+        digest = event['key_digest'] = key_digest(event['topic'], event['event_id'])
+    return digest
+
+def event_payload_json(event: Dict[str, Any]) -> str:
+    """Payload event sebagai teks JSON; diserialisasi sekali saat validasi (payload_json)"""
+    if 'payload_json' in event:
+        return event['payload_json']
+    return codec.dumps(event['payload'])
+
+def encode_queue_message(event: Dict[str, Any]) -> str:
+    """
+    Serialisasi event tervalidasi untuk queue: satu baris header JSON, newline, lalu teks
+    payload apa adanya. Timestamp dikirim sebagai epoch integer; payload tidak pernah
+    di-parse ulang sampai masuk kolom JSONB
+    """
+    header = {
+        "topic": event['topic'],
+        "event_id": event['event_id'],
+        "ts_us": event_epoch_us(event),
+        "source": event['source']
+    }
+    if 'accepted_us' in event:
+        # Waktu event diterima API, untuk latency end-to-end (/stats/latency)
+        header['accepted_us'] = event['accepted_us']
+    if 'batch_id' in event:
+        # Posisi event di batch /publish/batch asal, untuk status per event (GET /batches/{id})
+        header['batch_id'] = event['batch_id']
+        header['batch_index'] = event['batch_index']
+    header = codec.dumps(header)
+    # Codec JSON tidak pernah menghasilkan newline mentah, jadi newline pertama adalah pemisah
+    return f"{header}\n{event_payload_json(event)}"
+
+def decode_queue_message(data: str) -> Dict[str, Any]:
+    """
+    Kebalikan encode_queue_message; timestamp tetap berupa epoch integer (ts_us) dan
+    payload tetap teks JSON. Pesan lama (satu objek JSON) tetap diterima
+    """
+    header, separator, payload_json = data.partition('\n')
+    event = codec.loads(header)
+    if separator:
+        event['payload_json'] = payload_json
+    return event
+
+def render_event_row(row: Dict[str, Any]) -> str:
+    """Render satu row event ke JSON; teks JSONB payload disisipkan apa adanya"""
+    fields = {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items() if key != 'payload'
+    }
+    return f"{codec.dumps(fields)[:-1]},\"payload\":{row['payload']}}}"
+
+def render_events_response(rows: List[Dict[str, Any]], meta: Dict[str, Any]) -> str:
+    """
+    Bangun body JSON respons /events; teks JSONB payload dari database disisipkan
+    langsung tanpa json.loads / json.dumps ulang
+    """
+    rendered = ', '.join(render_event_row(row) for row in rows)
+    return f"{{\"events\": [{rendered}], {codec.dumps(meta)[1:]}"
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+EXPORT_COLUMNS = ["id", "topic", "event_id", "timestamp", "source", "processed_at", "payload"]
+
+async def render_export(rows: AsyncIterator[Dict[str, Any]], export_format: str,
+                        chunk_rows: int = 500) -> AsyncIterator[str]:
+    """Render row export ke NDJSON atau CSV, dikirim per chunk_rows baris"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+
+    pending = 0
+    async for row in rows:
+        if writer:
+            writer.writerow([
+                row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+                for column in EXPORT_COLUMNS
+            ])
+        else:
+            buffer.write(render_event_row(row))
+            buffer.write("\n")
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
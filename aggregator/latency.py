@@ -0,0 +1,116 @@
+"""
+Histogram latency end-to-end per topic: waktu sejak event diterima API (accepted_us)
+dan sejak timestamp event hingga baris ter-commit di processed_events
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from events import event_epoch_us
+
+PERCENTILES = (50, 95, 99)
+
+class HdrHistogram:
+    """
+    Histogram log-linear gaya HDR untuk nilai integer (mikrodetik): tiap pangkat dua dibagi
+    2^sub_bucket_bits sub-bucket, jadi error relatif kuantil maksimal 1 / 2^sub_bucket_bits
+    dengan memori sebanding jumlah bucket yang terisi, bukan jumlah sampel
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        exponent = value.bit_length() - 1
+        if exponent < self.sub_bucket_bits:
+            # Nilai kecil disimpan persis
+            return value
+        shift = exponent - self.sub_bucket_bits
+        return ((shift + 1) << self.sub_bucket_bits) + ((value >> shift) - (1 << self.sub_bucket_bits))
+
+    def _value(self, index: int) -> int:
+        """Batas atas bucket index (kuantil dilaporkan konservatif)"""
+        if index < (1 << self.sub_bucket_bits):
+            return index
+        shift = (index >> self.sub_bucket_bits) - 1
+        base = (index & ((1 << self.sub_bucket_bits) - 1)) + (1 << self.sub_bucket_bits)
+        return ((base + 1) << shift) - 1
+
+    def record(self, value: int):
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self, percentiles: Iterable[float]) -> List[int]:
+        targets = sorted(percentiles)
+        results: List[int] = []
+        if not self.total:
+            return [0] * len(targets)
+        cumulative = 0
+        pending = iter(targets)
+        target = next(pending)
+        for index in sorted(self.counts):
+            cumulative += self.counts[index]
+            while target is not None and cumulative >= self.total * target / 100:
+                results.append(min(self._value(index), self.max))
+                target = next(pending, None)
+            if target is None:
+                break
+        while len(results) < len(targets):
+            results.append(self.max)
+        return results
+
+class LatencyTracker:
+    """Histogram per (jenis, topic): 'accept' = commit - accepted_us, 'event' = commit - timestamp event"""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], HdrHistogram] = {}
+        self.started = time.time()
+
+    def _histogram(self, kind: str, topic: str) -> HdrHistogram:
+        key = (kind, metrics.topic_label(topic))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = HdrHistogram()
+        return histogram
+
+    def record_committed(self, events: List[Dict[str, Any]], results: List[bool]):
+        """Catat latency event baru yang baru saja ter-commit"""
+        commit_us = time.time_ns() // 1000
+        for event, is_new in zip(events, results):
+            if not is_new:
+                continue
+            accepted_us = event.get('accepted_us')
+            if accepted_us is not None:
+                self._histogram('accept', event['topic']).record(commit_us - accepted_us)
+            self._histogram('event', event['topic']).record(commit_us - event_epoch_us(event))
+
+    def snapshot(self, topic: Optional[str] = None) -> Dict[str, Any]:
+        """p50/p95/p99/max/mean dalam milidetik per topic dan jenis latency"""
+        topics: Dict[str, Dict[str, Any]] = {}
+        for (kind, label), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][1], item[0][0])):
+            if topic is not None and label != topic:
+                continue
+            p50, p95, p99 = histogram.percentiles(PERCENTILES)
+            topics.setdefault(label, {})[kind] = {
+                "count": histogram.total,
+                "p50_ms": round(p50 / 1000, 3),
+                "p95_ms": round(p95 / 1000, 3),
+                "p99_ms": round(p99 / 1000, 3),
+                "max_ms": round(histogram.max / 1000, 3),
+                "mean_ms": round(histogram.sum / histogram.total / 1000, 3)
+            }
+        return {
+            "since": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "topics": topics
+        }
+
+tracker = LatencyTracker()
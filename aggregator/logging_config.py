@@ -0,0 +1,116 @@
+"""
+Logging non-blocking untuk service aggregator: record log dimasukkan ke queue in-memory
+(QueueHandler) dan ditulis ke stderr oleh thread QueueListener, sehingga event loop tidak
+pernah menunggu I/O log. Log per event di hot path disampling, diganti ringkasan periodik
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from typing import List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Log per event: 1 dari LOG_SAMPLE_EVERY ditulis di level DEBUG
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1000"))
+LOG_SUMMARY_INTERVAL_SECONDS = float(os.getenv("LOG_SUMMARY_INTERVAL_SECONDS", "10"))
+
+# Logger uvicorn punya handler sendiri (propagate=False), ikut dipindah ke queue
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listeners: List[logging.handlers.QueueListener] = []
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler tanpa prepare(): record dikirim apa adanya sehingga formatting juga
+    terjadi di thread listener, dan formatter yang membaca record.args (uvicorn.access) tetap bekerja
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def _route_through_queue(logger: logging.Logger, handlers: List[logging.Handler]):
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    _listeners.append(listener)
+
+def _routed(logger: logging.Logger) -> bool:
+    return any(isinstance(handler, _DeferredQueueHandler) for handler in logger.handlers)
+
+def setup_logging():
+    """
+    Pasang QueueHandler pada root logger (level dari LOG_LEVEL, default INFO) dan logger uvicorn.
+    uvicorn.run() baru memasang handler loggernya setelah modul app diimport, jadi fungsi ini
+    dipanggil lagi dari startup hook; logger yang sudah lewat queue dilewati.
+    Listener dihentikan (dan queue dikosongkan) saat proses keluar
+    """
+    root = logging.getLogger()
+    if not _routed(root):
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        _route_through_queue(root, [stream_handler])
+
+    for name in UVICORN_LOGGERS:
+        logger = logging.getLogger(name)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, _DeferredQueueHandler)]
+        if handlers:
+            _route_through_queue(logger, handlers)
+
+class LogSampler:
+    """Izinkan 1 dari every log (every <= 1 berarti semua); dicek hanya jika level DEBUG aktif"""
+
+    def __init__(self, logger: logging.Logger, every: int = LOG_SAMPLE_EVERY):
+        self.logger = logger
+        self.every = max(1, every)
+        self._count = 0
+
+    def debug(self, msg: str, *args):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self._count += 1
+        if self._count >= self.every:
+            self._count = 0
+            self.logger.debug(msg, *args)
+
+class IngestSummary:
+    """Akumulasi hasil ingest dan tulis satu baris INFO per interval, menggantikan log per event"""
+
+    def __init__(self, logger: logging.Logger, interval: float = LOG_SUMMARY_INTERVAL_SECONDS):
+        self.logger = logger
+        self.interval = interval
+        self._reset(time.monotonic())
+
+    def _reset(self, now: float):
+        self.started = now
+        self.batches = 0
+        self.new = 0
+        self.duplicates = 0
+        self.cached = 0
+
+    def record(self, new: int, duplicates: int, cached: int = 0):
+        self.batches += 1
+        self.new += new
+        self.duplicates += duplicates
+        self.cached += cached
+        now = time.monotonic()
+        if now - self.started >= self.interval:
+            self.flush(now)
+
+    def flush(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if self.batches:
+            elapsed = max(now - self.started, 1e-9)
+            self.logger.info(
+                "Ingest summary: %d new, %d duplicates (%d from cache) in %d batches over %.1fs (%.0f events/s)",
+                self.new, self.duplicates, self.cached, self.batches, elapsed,
+                (self.new + self.duplicates) / elapsed
+            )
+        self._reset(now)
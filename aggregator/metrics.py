@@ -0,0 +1,218 @@
+"""
+Metrik in-process dalam format teks Prometheus untuk endpoint /metrics
+Counter, gauge dan histogram sederhana tanpa dependency tambahan; label topic
+dibatasi METRICS_MAX_TOPICS nilai berbeda, sisanya digabung ke "_other"
+"""
+import bisect
+import contextvars
+import math
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+OTHER_TOPIC = "_other"
+MIXED_TOPIC = "_mixed"
+MAX_TOPICS = int(os.getenv("METRICS_MAX_TOPICS", "100"))
+
+_registry: List["_Metric"] = []
+_topics: Set[str] = set()
+
+def topic_label(topic: Optional[str]) -> str:
+    """Nilai label topic dengan batas kardinalitas; topic baru di atas batas menjadi "_other" """
+    if not topic:
+        return ""
+    if topic in _topics or topic == MIXED_TOPIC:
+        return topic
+    if len(_topics) < MAX_TOPICS:
+        _topics.add(topic)
+        return topic
+    return OTHER_TOPIC
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _labels(self, values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._labels(labels)} {_format_value(value)}"
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def _samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._labels(labels)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per kombinasi label: hitungan per bucket (non-kumulatif, + satu untuk +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def _samples(self) -> Iterator[str]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{self._labels(labels, ('le', _format_value(float(bound))))} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {_format_value(total[0])}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+def render() -> str:
+    """Semua metrik terdaftar dalam format teks Prometheus"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram(
+    "aggregator_http_request_duration_seconds", "Latency of instrumented HTTP endpoints",
+    ("endpoint", "topic")
+)
+HTTP_REQUESTS_TOTAL = Counter(
+    "aggregator_http_requests_total", "Requests to instrumented HTTP endpoints by status code",
+    ("endpoint", "status")
+)
+
+# Database
+DB_ACQUIRE_SECONDS = Histogram(
+    "aggregator_db_acquire_seconds", "Time waiting for a connection from the asyncpg pool", ("pool",)
+)
+DB_QUERY_SECONDS = Histogram(
+    "aggregator_db_query_seconds", "Database statement time by operation", ("operation",)
+)
+DB_READS_TOTAL = Counter(
+    "aggregator_db_reads_total", "Read queries by the pool that served them", ("pool",)
+)
+DB_POOL_SIZE = Gauge("aggregator_db_pool_size", "Open connections in the asyncpg pool", ("pool",))
+DB_POOL_IN_USE = Gauge("aggregator_db_pool_in_use", "Connections currently checked out of the pool", ("pool",))
+DB_POOL_WAITERS = Gauge(
+    "aggregator_db_pool_waiters", "Coroutines waiting for a connection (including the adaptive limiter)", ("pool",)
+)
+DB_CONCURRENCY_LIMIT = Gauge(
+    "aggregator_db_concurrency_limit", "Current AIMD concurrency limit in front of the primary pool"
+)
+REPLICA_LAG_SECONDS = Gauge(
+    "aggregator_replica_lag_seconds", "Read replica replay lag (-1 when unknown or unreachable)"
+)
+EVENTS_TOTAL = Counter(
+    "aggregator_events_total", "Events processed by outcome", ("topic", "outcome")
+)
+
+# Consumer dan queue
+CONSUMER_BATCH_SIZE = Histogram(
+    "aggregator_consumer_batch_size", "Messages per consumer batch", buckets=SIZE_BUCKETS
+)
+CONSUMER_BATCH_SECONDS = Histogram(
+    "aggregator_consumer_batch_seconds", "Consumer time to write one batch to Postgres"
+)
+QUEUE_DEPTH = Gauge("aggregator_queue_depth", "Messages waiting in the queue", ("backend",))
+QUEUE_PENDING = Gauge("aggregator_queue_pending", "Delivered but unacknowledged stream entries", ("backend",))
+QUEUE_LAG = Gauge("aggregator_queue_lag", "Stream entries not yet delivered to the consumer group", ("backend",))
+
+# Topic request berjalan, diisi handler dan dibaca MetricsMiddleware setelah respons selesai
+_request_topic: contextvars.ContextVar[Optional[Dict[str, Optional[str]]]] = contextvars.ContextVar(
+    "request_topic", default=None
+)
+
+def set_request_topic(topic: Optional[str]):
+    """Dipanggil handler untuk memberi label topic pada latency request saat ini"""
+    holder = _request_topic.get()
+    if holder is not None:
+        holder["topic"] = topic
+
+def set_batch_topic(events: List[Dict[str, object]]):
+    """Label topic untuk request batch: topic bersama, atau "_mixed" jika batch berisi beberapa topic"""
+    topics = {event['topic'] for event in events}
+    set_request_topic(topics.pop() if len(topics) == 1 else MIXED_TOPIC)
+
+class MetricsMiddleware:
+    """Middleware ASGI yang mengukur latency endpoint di paths"""
+
+    def __init__(self, app, paths: Sequence[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        holder: Dict[str, Optional[str]] = {"topic": None}
+        token = _request_topic.set(holder)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_topic.reset(token)
+            path = scope["path"]
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, path, topic_label(holder["topic"]))
+            HTTP_REQUESTS_TOTAL.inc(path, str(status))
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+class PoolUsage:
+    """Hitungan koneksi yang sedang dipinjam dan coroutine yang menunggu acquire pada satu pool"""
+
+    def __init__(self):
+        self.in_use = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+
+    def start_wait(self):
+        self.waiting += 1
+        if self.waiting > self.max_waiting:
+            self.max_waiting = self.waiting
+
+    def stats(self, pool: Optional[asyncpg.Pool]) -> Dict[str, Any]:
+        return {
+            "size": pool.get_size() if pool is not None else 0,
+            "max_size": pool.get_max_size() if pool is not None else 0,
+            "idle": pool.get_idle_size() if pool is not None else 0,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "acquired": self.acquired
+        }
+
+class AimdLimiter:
+    """
+    Batas konkurensi adaptif (AIMD, sinyal ala Vegas) di depan pool: tiap sampel dibandingkan dengan
+    baseline operasinya sendiri, yaitu latency terendah yang pernah terlihat, karena query berbeda punya
+    latency normal yang berbeda. Jika rata-rata rasio latency/baseline satu window di atas tolerance,
+    batas dikali backoff; di bawahnya (dan batas benar-benar terpakai) batas naik satu. Sampel di bawah
+    latency_target tidak pernah dianggap macet. Coroutine di atas batas antri FIFO di sini, bukan di dalam
+    pool.acquire()
+    """
+
+    # Baseline naik 5% per window agar database yang memang melambat permanen (tabel membesar)
+    # tidak terus dianggap macet; sampel yang lebih cepat langsung menurunkannya lagi
+    BASELINE_DRIFT = 1.05
+
+    def __init__(self, max_limit: int, min_limit: int = 2, latency_target: float = 0.1,
+                 backoff: float = 0.9, window: int = 20, tolerance: float = 2.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.latency_target = latency_target
+        self.backoff = min(max(backoff, 0.1), 0.99)
+        self.window = max(1, window)
+        self.tolerance = max(1.1, tolerance)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._baselines: Dict[str, float] = {}
+        self._samples = 0
+        self._ratio_sum = 0.0
+        self._saturated = False
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Tunggu slot konkurensi; wajib dipasangkan dengan release()"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self._take_slot()
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot sudah diberikan tepat sebelum dibatalkan: kembalikan
+                self.release(None)
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def _take_slot(self):
+        self.in_flight += 1
+        if self.in_flight >= int(self.limit):
+            self._saturated = True
+
+    def release(self, latency: Optional[float], operation: str = "query", rows: int = 1):
+        """
+        Kembalikan slot; latency (detik) None berarti tidak dihitung sebagai sampel.
+        Untuk operasi batch, latency dinormalisasi per baris dan baseline dipisah per ukuran batch
+        (kelipatan dua), sehingga batch besar tidak terbaca sebagai database yang macet
+        """
+        self.in_flight -= 1
+        if latency is not None:
+            if rows > 1:
+                latency /= rows
+                operation = f"{operation}:{rows.bit_length()}"
+            self._observe(latency, operation)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self._take_slot()
+                future.set_result(None)
+
+    def _observe(self, latency: float, operation: str):
+        baseline = min(latency, self._baselines.get(operation, latency))
+        self._baselines[operation] = baseline
+        self._samples += 1
+        if latency > self.latency_target and baseline > 0:
+            self._ratio_sum += latency / baseline
+        else:
+            self._ratio_sum += 1.0
+        if self._samples < self.window:
+            return
+
+        ratio = self._ratio_sum / self._samples
+        if ratio > self.tolerance:
+            limit = max(float(self.min_limit), self.limit * self.backoff)
+            if int(limit) < int(self.limit):
+                logger.debug("Concurrency limit %d -> %d (query latency %.1fx baseline)",
+                             int(self.limit), int(limit), ratio)
+            self.limit = limit
+            self.decreases += 1
+        elif self._saturated and self.limit < self.max_limit:
+            # Naik hanya jika batas sempat penuh; tanpa beban batas tidak perlu membengkak
+            self.limit = min(float(self.max_limit), self.limit + 1)
+            self.increases += 1
+        for key in self._baselines:
+            self._baselines[key] *= self.BASELINE_DRIFT
+        self._samples = 0
+        self._ratio_sum = 0.0
+        self._saturated = self.in_flight >= int(self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "latency_target_ms": round(self.latency_target * 1000, 3),
+            "tolerance": self.tolerance,
+            "baselines_ms": {key: round(value * 1000, 3) for key, value in sorted(self._baselines.items())},
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
+
+def create_pool_limiter(max_size: int) -> Optional[AimdLimiter]:
+    """Batas konkurensi adaptif aktif dengan POOL_ADAPTIVE=true; batas atas = ukuran maksimum pool"""
+    if os.getenv("POOL_ADAPTIVE", "false").lower() != "true":
+        return None
+    return AimdLimiter(
+        max_limit=max_size,
+        min_limit=int(os.getenv("POOL_ADAPTIVE_MIN_LIMIT", "2")),
+        latency_target=float(os.getenv("POOL_ADAPTIVE_LATENCY_TARGET_MS", "100")) / 1000,
+        backoff=float(os.getenv("POOL_ADAPTIVE_BACKOFF", "0.9")),
+        window=int(os.getenv("POOL_ADAPTIVE_WINDOW", "20")),
+        tolerance=float(os.getenv("POOL_ADAPTIVE_TOLERANCE", "2"))
+    )
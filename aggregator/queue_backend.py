@@ -0,0 +1,174 @@
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+# (message_id, data); message_id None untuk backend tanpa ack
+QueueMessage = Tuple[Optional[str], str]
+
+# Pesan yang ditolak database disimpan apa adanya di "<key>:dead" agar bisa diperiksa dan
+# di-enqueue ulang setelah diperbaiki; hanya DEAD_LETTER_MAX_LEN pesan terakhir yang disimpan
+DEAD_LETTER_MAX_LEN = int(os.getenv("DEAD_LETTER_MAX_LEN", "10000"))
+
+class ListQueue:
+    """
+    Backend queue berbasis Redis list (RPUSH / LPOP)
+    Pesan yang sudah di-pop tapi belum ditulis ke Postgres hilang jika proses mati;
+    batch yang gagal ditulis dikembalikan ke kepala list dengan requeue()
+    """
+
+    backend = "list"
+
+    def __init__(self, client: redis.Redis, key: str = "event_queue"):
+        self.client = client
+        self.key = key
+
+    async def setup(self):
+        pass
+
+    async def enqueue(self, messages: List[str]):
+        if messages:
+            await self.client.rpush(self.key, *messages)
+
+    async def consume(self, count: int, consumer: str) -> List[QueueMessage]:
+        """Ambil hingga count pesan, blocking sebentar jika queue kosong"""
+        messages = await self.client.lpop(self.key, count)
+        if not messages:
+            # Queue kosong: tunggu pesan pertama dengan blocking pop, lalu ambil sisanya sekaligus
+            result = await self.client.blpop(self.key, timeout=1)
+            if not result:
+                return []
+            _, first_message = result
+            rest = await self.client.lpop(self.key, count - 1) if count > 1 else None
+            messages = [first_message] + (rest or [])
+        return [(None, message) for message in messages]
+
+    async def requeue(self, messages: List[str]):
+        """Kembalikan pesan ke kepala list dengan urutan semula"""
+        if messages:
+            await self.client.lpush(self.key, *reversed(messages))
+
+    async def dead_letter(self, messages: List[str]):
+        if not messages:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(f"{self.key}:dead", *messages)
+        pipe.ltrim(f"{self.key}:dead", -DEAD_LETTER_MAX_LEN, -1)
+        await pipe.execute()
+
+    async def ack(self, message_ids: List[Optional[str]]):
+        pass
+
+    async def length(self) -> int:
+        return await self.client.llen(self.key)
+
+    async def info(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "length": await self.length()}
+
+class StreamQueue:
+    """
+    Backend queue berbasis Redis Streams dengan consumer group (XADD / XREADGROUP / XACK)
+    Pesan baru di-ack setelah tersimpan di Postgres (at-least-once); entry yang macet
+    di consumer yang mati diambil alih dengan XAUTOCLAIM
+    """
+
+    backend = "stream"
+
+    def __init__(self, client: redis.Redis, key: str = "event_stream", group: str = "aggregator",
+                 claim_idle_ms: int = 60000, claim_interval: float = 15.0):
+        self.client = client
+        self.key = key
+        self.group = group
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._last_claim: Dict[str, float] = {}
+
+    async def setup(self):
+        """Buat consumer group (dan stream) jika belum ada"""
+        try:
+            await self.client.xgroup_create(self.key, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def consumer_name(self, consumer: str) -> str:
+        return f"{self.consumer_prefix}-{consumer}"
+
+    async def enqueue(self, messages: List[str]):
+        if not messages:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipe.xadd(self.key, {"data": message})
+        await pipe.execute()
+
+    async def consume(self, count: int, consumer: str) -> List[QueueMessage]:
+        name = self.consumer_name(consumer)
+
+        # Sesekali ambil alih entry yang terlalu lama pending di consumer lain
+        now = time.monotonic()
+        if now - self._last_claim.get(name, 0.0) >= self.claim_interval:
+            self._last_claim[name] = now
+            claimed = await self.client.xautoclaim(
+                self.key, self.group, name, min_idle_time=self.claim_idle_ms, start_id="0-0", count=count
+            )
+            entries = [(message_id, fields) for message_id, fields in claimed[1] if fields]
+            if entries:
+                logger.warning(f"Reclaimed {len(entries)} stuck stream entries for {name}")
+                return [(message_id, fields["data"]) for message_id, fields in entries]
+
+        response = await self.client.xreadgroup(self.group, name, {self.key: ">"}, count=count, block=1000)
+        if not response:
+            return []
+        _, entries = response[0]
+        return [(message_id, fields["data"]) for message_id, fields in entries]
+
+    async def dead_letter(self, messages: List[str]):
+        if not messages:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipe.xadd(f"{self.key}:dead", {"data": message}, maxlen=DEAD_LETTER_MAX_LEN, approximate=True)
+        await pipe.execute()
+
+    async def ack(self, message_ids: List[Optional[str]]):
+        """Ack lalu hapus entry agar stream tidak tumbuh tanpa batas"""
+        ids = [message_id for message_id in message_ids if message_id]
+        if not ids:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.xack(self.key, self.group, *ids)
+        pipe.xdel(self.key, *ids)
+        await pipe.execute()
+
+    async def length(self) -> int:
+        return await self.client.xlen(self.key)
+
+    async def info(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"backend": self.backend, "length": await self.length()}
+        for group in await self.client.xinfo_groups(self.key):
+            if group.get("name") == self.group:
+                info["pending"] = group.get("pending", 0)
+                info["lag"] = group.get("lag")
+                info["consumers"] = group.get("consumers", 0)
+        return info
+
+def create_queue(client: redis.Redis, backend: Optional[str] = None):
+    """Pilih backend queue dari konfigurasi QUEUE_BACKEND (list | stream)"""
+    backend = (backend or os.getenv("QUEUE_BACKEND", "list")).lower()
+    if backend == "stream":
+        return StreamQueue(
+            client,
+            claim_idle_ms=int(os.getenv("STREAM_CLAIM_IDLE_MS", "60000")),
+            claim_interval=float(os.getenv("STREAM_CLAIM_INTERVAL_SECONDS", "15"))
+        )
+    if backend != "list":
+        raise ValueError(f"Unknown QUEUE_BACKEND: {backend}")
+    return ListQueue(client)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import asyncpg
+
+import metrics
+from pool_limiter import PoolUsage
+
+logger = logging.getLogger(__name__)
+
+# Lag replay dalam detik; 0 jika server bukan standby, atau WAL receiver sedang streaming dan semua
+# WAL yang diterima sudah di-replay (pg_last_xact_replay_timestamp saja akan terus menua saat primary
+# idle). Receiver yang putus tidak pernah dilaporkan 0: receive_lsn berhenti sehingga selalu sama dengan
+# replay_lsn. status pg_stat_wal_receiver hanya terlihat oleh role dengan pg_read_all_stats; tanpa itu
+# lag selalu dihitung dari timestamp replay. NULL = belum pernah replay
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE EXTRACT(EPOCH FROM clock_timestamp() - pg_last_xact_replay_timestamp())
+    END::FLOAT8 AS lag_seconds
+"""
+
+# Error yang menandakan replica tidak bisa dipakai (bukan error query biasa)
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+                     asyncpg.InterfaceError, asyncpg.CannotConnectNowError)
+
+class ReadReplica:
+    """
+    Pool asyncpg terpisah untuk query baca (/events, /stats, export) ke read replica.
+    Lag dicek periodik; replica dianggap sehat hanya jika terhubung dan lag <= max_lag_seconds,
+    selain itu pembaca kembali ke pool primary
+    """
+
+    def __init__(self, dsn: str, max_lag_seconds: float = 5.0, check_interval: float = 1.0,
+                 min_size: int = 2, max_size: int = 10, command_timeout: Optional[float] = 30.0,
+                 init: Optional[Callable[[asyncpg.Connection], Awaitable[None]]] = None):
+        self.dsn = dsn
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = max(0.1, check_interval)
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.command_timeout = command_timeout
+        self.init = init
+        self.pool: Optional[asyncpg.Pool] = None
+        self.usage = PoolUsage()
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self.reads = 0
+        self.fallbacks = 0
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    @property
+    def healthy(self) -> bool:
+        return (self.pool is not None and self.last_error is None
+                and self.lag_seconds is not None and self.lag_seconds <= self.max_lag_seconds)
+
+    @property
+    def status(self) -> str:
+        if self.pool is None or self.last_error is not None:
+            return "down"
+        return "healthy" if self.healthy else "lagging"
+
+    async def start(self):
+        """Buka pool dan mulai monitor lag; replica yang mati saat startup tidak menggagalkan aplikasi"""
+        await self.check()
+        self._monitor_task = asyncio.create_task(self._monitor_loop())
+
+    async def check(self):
+        """Buat pool jika belum ada lalu ukur lag replay; replica yang hang dianggap down setelah timeout"""
+        timeout = self.check_interval * 5
+        try:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.dsn, min_size=self.min_size, max_size=self.max_size, init=self.init,
+                    timeout=timeout, command_timeout=self.command_timeout
+                )
+                logger.info("Read replica pool connected")
+            async with self.pool.acquire(timeout=timeout) as conn:
+                self.lag_seconds = await conn.fetchval(LAG_SQL, timeout=timeout)
+            self.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self.last_error is None:
+                logger.warning(f"Read replica unavailable, reads fall back to primary: {e}")
+            self.last_error = str(e)
+        self.last_checked = time.time()
+        metrics.REPLICA_LAG_SECONDS.set(self.lag_seconds if self.lag_seconds is not None else -1)
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    def mark_failed(self, error: BaseException):
+        """Dipanggil pembaca saat koneksi replica putus; berlaku hingga check berikutnya berhasil"""
+        if self.last_error is None:
+            logger.warning(f"Read replica connection failed, reads fall back to primary: {error}")
+        self.last_error = str(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "status": self.status,
+            "lag_seconds": None if self.lag_seconds is None else round(self.lag_seconds, 3),
+            "max_lag_seconds": self.max_lag_seconds,
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+            "last_error": self.last_error
+        }
+
+    async def close(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+        if self.pool is not None:
+            await self.pool.close()
+
+def create_read_replica(init: Optional[Callable[[asyncpg.Connection], Awaitable[None]]] = None) -> Optional[ReadReplica]:
+    """Read replica aktif jika READ_DATABASE_URL di-set"""
+    dsn = os.getenv("READ_DATABASE_URL")
+    if not dsn:
+        return None
+    return ReadReplica(
+        dsn,
+        max_lag_seconds=float(os.getenv("READ_REPLICA_MAX_LAG_SECONDS", "5")),
+        check_interval=float(os.getenv("READ_REPLICA_CHECK_INTERVAL_SECONDS", "1")),
+        min_size=int(os.getenv("READ_POOL_MIN_SIZE", "2")),
+        max_size=int(os.getenv("READ_POOL_MAX_SIZE", "10")),
+        # Batas waktu per query di replica (detik); 0 = tanpa batas
+        command_timeout=float(os.getenv("READ_REPLICA_COMMAND_TIMEOUT_SECONDS", "30")) or None,
+        init=init
+    )
@@ -0,0 +1,177 @@
+import logging
+import os
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = max(1, int(os.getenv("STREAM_CHUNK_SIZE", "1000")))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+# Output dekompresi diproses per potongan maksimal sebesar ini, agar body kecil yang mengembang
+# sangat besar (bom kompresi) ditolak oleh batas panjang baris sebelum memenuhi memori
+DECOMPRESS_PIECE_BYTES = 64 * 1024
+# zstd decompressobj tidak punya batas output; input diumpankan sedikit demi sedikit
+# (satu blok RLE 4 byte bisa mengembang menjadi 128 KiB, jadi 64 byte input <= ~2 MiB output)
+ZSTD_INPUT_SLICE_BYTES = 64
+# Detail reject yang dikembalikan dibatasi; jumlah reject tetap dihitung semua
+MAX_REJECT_DETAILS = 1000
+
+# flush menerima event tervalidasi; returns hasil per event (True baru / False duplikat)
+# atau None jika event hanya di-queue dan hasil dedup belum diketahui
+FlushChunk = Callable[[List[Dict[str, Any]]], Awaitable[Optional[List[bool]]]]
+
+class StreamRejected(Exception):
+    """Flush ditolak (mis. backpressure); berhenti membaca body"""
+
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers or {}
+
+def _decompressor(content_encoding: str):
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    if encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise HTTPException(status_code=415, detail="zstd encoding requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
+
+# decompressobj zstandard juga punya atribut unconsumed_tail, jadi zlib dikenali dari tipenya
+_ZLIB_DECOMPRESS = type(zlib.decompressobj())
+
+def _decompress_pieces(decompressor, data: bytes) -> Iterator[bytes]:
+    """Dekompresi data menjadi potongan output berukuran terbatas"""
+    if isinstance(decompressor, _ZLIB_DECOMPRESS):
+        # zlib: batasi output lewat max_length, sisa input ada di unconsumed_tail
+        while True:
+            piece = decompressor.decompress(data, DECOMPRESS_PIECE_BYTES)
+            data = decompressor.unconsumed_tail
+            if piece:
+                yield piece
+            if not data and len(piece) < DECOMPRESS_PIECE_BYTES:
+                return
+    for start in range(0, len(data), ZSTD_INPUT_SLICE_BYTES):
+        piece = decompressor.decompress(data[start:start + ZSTD_INPUT_SLICE_BYTES])
+        if piece:
+            yield piece
+
+async def iter_ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """Baca body secara bertahap (dengan dekompresi) dan hasilkan (nomor_baris, isi_baris)"""
+    decompressor = _decompressor(request.headers.get("content-encoding", ""))
+    buffer = b""
+    line_no = 0
+
+    async for chunk in request.stream():
+        if decompressor is not None and chunk:
+            pieces = _decompress_pieces(decompressor, chunk)
+        else:
+            pieces = (chunk,)
+        # Batas panjang baris dicek per potongan, sebelum potongan berikutnya didekompresi
+        for piece in pieces:
+            buffer += piece
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_no += 1
+                yield line_no, line
+            if len(buffer) > STREAM_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line {line_no + 1} exceeds {STREAM_MAX_LINE_BYTES} bytes")
+
+    if decompressor is not None and hasattr(decompressor, "flush"):
+        buffer += decompressor.flush()
+        if len(buffer) > STREAM_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line {line_no + 1} exceeds {STREAM_MAX_LINE_BYTES} bytes")
+    if buffer:
+        line_no += 1
+        yield line_no, buffer
+
+async def ingest_ndjson(request: Request, validate: Callable[[Any], Dict[str, Any]], flush: FlushChunk) -> Dict[str, Any]:
+    """
+    Ingest NDJSON: parse dan validasi per baris, flush per STREAM_CHUNK_SIZE event
+    selagi body masih diterima. Returns ringkasan accepted / duplicate / rejected
+    """
+    summary: Dict[str, Any] = {
+        "lines": 0,
+        "accepted": 0,
+        "processed": 0,
+        "duplicates": 0,
+        "rejected": 0,
+        "rejects": []
+    }
+    queued_only = False
+    chunk: List[Dict[str, Any]] = []
+    chunk_first_line = 1
+
+    async def flush_chunk():
+        nonlocal queued_only
+        results = await flush(chunk)
+        summary["accepted"] += len(chunk)
+        if results is None:
+            queued_only = True
+        else:
+            new_count = sum(results)
+            summary["processed"] += new_count
+            summary["duplicates"] += len(results) - new_count
+        chunk.clear()
+
+    def reject(line_no: int, error: str):
+        summary["rejected"] += 1
+        if len(summary["rejects"]) < MAX_REJECT_DETAILS:
+            summary["rejects"].append({"line": line_no, "error": error})
+
+    try:
+        async for line_no, line in iter_ndjson_lines(request):
+            summary["lines"] = line_no
+            if not line.strip():
+                continue
+            try:
+                record = codec.loads(line)
+            except Exception as e:
+                reject(line_no, f"Invalid JSON: {e}")
+                continue
+            try:
+                event = validate(record)
+            except ValidationError as e:
+                reject(line_no, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                continue
+            except HTTPException as e:
+                reject(line_no, str(e.detail))
+                continue
+
+            if not chunk:
+                chunk_first_line = line_no
+            chunk.append(event)
+
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                await flush_chunk()
+
+        if chunk:
+            await flush_chunk()
+    except StreamRejected as e:
+        # Event yang sudah di-flush tetap diterima; producer bisa melanjutkan dari resume_from_line
+        summary["status"] = "partial"
+        summary["error"] = e.detail
+        summary["resume_from_line"] = chunk_first_line
+        status_code, headers = e.status_code, e.headers
+    else:
+        summary["status"] = "accepted"
+        status_code, headers = 200, {}
+
+    if queued_only:
+        # Hasil dedup baru diketahui setelah consumer memproses queue
+        summary["processed"] = None
+        summary["duplicates"] = None
+    return {"status_code": status_code, "headers": headers, "summary": summary}
@@ -0,0 +1,77 @@
+"""
+Benchmark waktu membangun respons /events?limit=1000 untuk tiap codec JSON
+Membandingkan jalur lama FastAPI (json.loads payload + jsonable_encoder + JSONResponse)
+dengan render_events_response (payload JSONB disisipkan) di atas stdlib, orjson dan msgspec
+
+Jalankan: python benchmarks/bench_codec.py [jumlah_row]
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aggregator"))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import codec
+from events import render_events_response
+
+def make_rows(count):
+    """Row seperti keluaran Database.get_events: payload berupa teks JSONB"""
+    base = datetime(2026, 1, 1)
+    rows = []
+    for i in range(count):
+        payload = {
+            "user_id": str(uuid.uuid4()),
+            "action": "login",
+            "details": "x" * 200,
+            "metadata": {"ip_address": "10.0.0.1", "user_agent": "bench/1.0", "session_id": str(uuid.uuid4())}
+        }
+        rows.append({
+            "topic": "bench",
+            "event_id": str(uuid.uuid4()),
+            "timestamp": base + timedelta(seconds=i),
+            "source": "service_1",
+            "payload": json.dumps(payload),
+            "processed_at": base + timedelta(seconds=i, milliseconds=5)
+        })
+    return rows
+
+def legacy_response(rows, meta):
+    events = []
+    for row in rows:
+        event = dict(row)
+        event["payload"] = json.loads(event["payload"])
+        event["timestamp"] = event["timestamp"].isoformat()
+        event["processed_at"] = event["processed_at"].isoformat()
+        events.append(event)
+    return JSONResponse(jsonable_encoder({"events": events, **meta})).body
+
+def spliced_response(rows, meta):
+    return render_events_response(rows, meta).encode()
+
+def bench(name, func, rows, meta, rounds=20):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(rows, meta)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:24s} {best * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rows = make_rows(count)
+    meta = {"count": count, "topic_filter": None, "limit": count}
+    print(f"=== /events response build, {count} rows (best of 20) ===")
+    bench("legacy (fastapi+json)", legacy_response, rows, meta)
+    for name in ("json", "orjson", "msgspec"):
+        try:
+            codec.set_backend(name)
+        except ImportError:
+            print(f"{'spliced (' + name + ')':24s} not installed")
+            continue
+        bench(f"spliced ({name})", spliced_response, rows, meta)
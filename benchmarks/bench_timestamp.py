@@ -0,0 +1,73 @@
+"""
+Microbenchmark parsing timestamp di jalur ingest: jalur lama (parse di validasi lalu
+parse ulang string di database layer) vs jalur baru (parse sekali, epoch integer di queue)
+
+Jalankan: python benchmarks/bench_timestamp.py [jumlah_event]
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aggregator"))
+
+from events import parse_timestamp, encode_queue_message, decode_queue_message, event_epoch_us
+
+def make_events(count):
+    base = datetime.now(timezone.utc)
+    return [
+        {
+            "topic": "bench",
+            "event_id": str(uuid.uuid4()),
+            "timestamp": (base + timedelta(milliseconds=i)).isoformat().replace("+00:00", "Z"),
+            "source": "bench_source",
+            "payload": {"value": i}
+        }
+        for i in range(count)
+    ]
+
+def legacy_parse_timestamp(timestamp_str):
+    """Salinan parse di process_event_idempotent sebelum perubahan"""
+    if timestamp_str.endswith('Z'):
+        timestamp_str = timestamp_str[:-1] + '+00:00'
+    parsed_timestamp = datetime.fromisoformat(timestamp_str)
+    if parsed_timestamp.tzinfo is not None:
+        parsed_timestamp = parsed_timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed_timestamp
+
+def old_path(events):
+    for raw in events:
+        # validate_event: parse lalu hasilnya dibuang
+        datetime.fromisoformat(raw["timestamp"].replace("Z", "+00:00"))
+        message = json.dumps(dict(raw))
+        # consumer + process_event_idempotent: parse ulang string
+        event = json.loads(message)
+        legacy_parse_timestamp(event["timestamp"])
+
+def new_path(events):
+    for raw in events:
+        # validate_event: parse sekali ke datetime UTC
+        validated = dict(raw, timestamp=parse_timestamp(raw["timestamp"]))
+        message = encode_queue_message(validated)
+        # consumer + database layer: epoch integer langsung ke Postgres, tanpa parse string
+        event = decode_queue_message(message)
+        event_epoch_us(event)
+
+def bench(name, func, events, rounds=3):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(events)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:10s} {best * 1000:9.1f} ms  {len(events) / best:12,.0f} events/sec")
+    return best
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = make_events(count)
+    print(f"=== Timestamp ingest path, {count} events (best of 3) ===")
+    old = bench("old", old_path, events)
+    new = bench("new", new_path, events)
+    print(f"speedup    {old / new:9.2f}x")
@@ -18,6 +18,18 @@ logger = logging.getLogger(__name__)
 
 fake = Faker()
 
+# Serialisasi request body dengan orjson jika terpasang, fallback ke stdlib json
+try:
+    import orjson
+    
+    def dumps_json(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps_json(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 class EventPublisher:
     def __init__(self, aggregator_url: str):
         self.aggregator_url = aggregator_url.rstrip('/')
@@ -63,7 +75,8 @@ class EventPublisher:
         try:
             response = self.session.post(
                 f"{self.aggregator_url}/publish",
-                json=event,
+                data=dumps_json(event),
+                headers=JSON_HEADERS,
                 timeout=10
             )
             
@@ -84,7 +97,8 @@ class EventPublisher:
             batch_data = {"events": events}
             response = self.session.post(
                 f"{self.aggregator_url}/publish/batch",
-                json=batch_data,
+                data=dumps_json(batch_data),
+                headers=JSON_HEADERS,
                 timeout=30
             )
             
@@ -481,6 +481,344 @@ class TestPubSubAggregator:
         assert found_event is not None
         assert found_event["payload"] == complex_payload
 
+    def test_topics_registry(self):
+        """Test 21: Topic registry - topics_count dan counter per topic"""
+        topic = f"registry_test_{uuid.uuid4().hex[:8]}"
+        initial_stats = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        
+        events = [self.create_test_event(topic=topic) for _ in range(3)]
+        for event in events:
+            requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        requests.post(f"{AGGREGATOR_URL}/publish", json=events[0])  # Duplikat
+        
+        time.sleep(2)
+        
+        final_stats = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        assert final_stats["topics_count"] == initial_stats["topics_count"] + 1
+        
+        response = requests.get(f"{AGGREGATOR_URL}/topics")
+        assert response.status_code == 200
+        
+        registry = {t["topic"]: t for t in response.json()["topics"]}
+        assert topic in registry
+        assert registry[topic]["event_count"] == 3  # Duplikat tidak dihitung
+        assert registry[topic]["first_seen"] <= registry[topic]["last_seen"]
+
+    def test_dedup_cache_short_circuit(self):
+        """Test 22: Duplikat yang sudah dikenal dipotong oleh cache in-process"""
+        event = self.create_test_event(topic="dedup_cache_test")
+        requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        
+        stats1 = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        assert "dedup_cache" in stats1
+        if not stats1["dedup_cache"]["enabled"]:
+            pytest.skip("Dedup cache disabled")
+        
+        response = requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        assert response.json()["processed"] is False
+        
+        stats2 = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        assert stats2["dedup_cache"]["hits"] > stats1["dedup_cache"]["hits"]
+        assert stats2["duplicate_dropped_count"] == stats1["duplicate_dropped_count"] + 1
+
+    def test_ndjson_stream_ingest(self):
+        """Test 23: NDJSON streaming ingest (gzip dan zstd) dengan ringkasan per baris"""
+        import gzip
+        zstandard = pytest.importorskip("zstandard")
+        
+        compressors = {"gzip": gzip.compress, "zstd": zstandard.ZstdCompressor().compress}
+        for encoding, compress in compressors.items():
+            events = [self.create_test_event(topic="stream_test") for _ in range(5)]
+            lines = [json.dumps(event) for event in events]
+            lines.insert(2, "{not json")
+            lines.append(json.dumps({"topic": "stream_test"}))  # Field wajib hilang
+            body = compress(("\n".join(lines) + "\n").encode())
+            
+            response = requests.post(
+                f"{AGGREGATOR_URL}/publish/stream",
+                data=body,
+                headers={"Content-Type": "application/x-ndjson", "Content-Encoding": encoding},
+                timeout=30
+            )
+            assert response.status_code == 200, encoding
+            
+            summary = response.json()
+            assert summary["accepted"] == 5
+            assert summary["rejected"] == 2
+            assert [reject["line"] for reject in summary["rejects"]] == [3, 7]
+
+    def test_events_cursor_pagination(self):
+        """Test 24: Keyset pagination /events dengan cursor"""
+        topic = f"paging_test_{uuid.uuid4().hex[:8]}"
+        events = [self.create_test_event(topic=topic) for _ in range(5)]
+        requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": events})
+        
+        time.sleep(2)
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"topic": topic, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            page = requests.get(f"{AGGREGATOR_URL}/events", params=params).json()
+            seen.extend(e["event_id"] for e in page["events"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        
+        # Semua event muncul tepat sekali di seluruh halaman
+        assert sorted(seen) == sorted(e["event_id"] for e in events)
+        
+        response = requests.get(f"{AGGREGATOR_URL}/events", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+        
+        # Epoch di luar rentang datetime juga cursor tidak valid, bukan 500
+        import base64
+        huge = base64.urlsafe_b64encode(b"99999999999999999999999:1").decode().rstrip("=")
+        response = requests.get(f"{AGGREGATOR_URL}/events", params={"cursor": huge})
+        assert response.status_code == 400
+
+    def test_events_export_stream(self):
+        """Test 25: Export NDJSON streaming dengan filter topic"""
+        topic = f"export_test_{uuid.uuid4().hex[:8]}"
+        events = [self.create_test_event(topic=topic) for _ in range(3)]
+        requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": events})
+        
+        time.sleep(2)
+        
+        response = requests.get(f"{AGGREGATOR_URL}/events/export", params={"topic": topic}, stream=True)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        
+        exported = [json.loads(line) for line in response.iter_lines() if line]
+        assert sorted(e["event_id"] for e in exported) == sorted(e["event_id"] for e in events)
+        assert all(e["payload"] == events[0]["payload"] for e in exported)
+
+    def test_partitioned_dedup(self):
+        """Test 26: Dedup tetap berlaku pada processed_events terpartisi"""
+        stats = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        if "partitions" not in stats:
+            pytest.skip("PARTITION_MODE not enabled")
+        # Partisi hari ini dan beberapa hari ke depan sudah dibuat saat startup
+        assert len(stats["partitions"]) >= 2
+        # Partisi DEFAULT menampung insert jika maintenance gagal dan normalnya kosong
+        assert "processed_events_default" in [p["name"] for p in stats["partitions"]]
+        
+        event = self.create_test_event(topic="partition_test")
+        requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": [event, event]})
+        requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        
+        time.sleep(2)
+        
+        response = requests.get(f"{AGGREGATOR_URL}/events", params={"topic": "partition_test", "limit": 1000})
+        matches = [e for e in response.json()["events"] if e["event_id"] == event["event_id"]]
+        assert len(matches) == 1
+
+    def test_digest_dedup_key(self):
+        """Test 27: Dedup lewat digest 16 byte (DEDUP_KEY=digest)"""
+        stats = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        if stats.get("dedup_key") != "digest":
+            pytest.skip("DEDUP_KEY=digest not enabled")
+        
+        topic = f"digest_test_{uuid.uuid4().hex[:8]}"
+        event = self.create_test_event(topic=topic)
+        # event_id yang sama di topic lain bukan duplikat
+        other = self.create_test_event(topic=topic + "x", event_id=event["event_id"])
+        requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": [event, event, other]})
+        
+        time.sleep(2)
+        
+        response = requests.get(f"{AGGREGATOR_URL}/events", params={"topic": topic})
+        assert [e["event_id"] for e in response.json()["events"]] == [event["event_id"]]
+        response = requests.get(f"{AGGREGATOR_URL}/events", params={"topic": topic + "x"})
+        assert len(response.json()["events"]) == 1
+
+    def test_dedup_window_expiry(self):
+        """Test 28: Event di luar DEDUP_WINDOW_SECONDS diterima lagi sebagai event baru"""
+        stats = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        window = stats.get("dedup_window", {}).get("seconds")
+        if not window or window > 5:
+            pytest.skip("Requires DEDUP_WINDOW_SECONDS <= 5")
+        
+        topic = f"window_test_{uuid.uuid4().hex[:8]}"
+        event = self.create_test_event(topic=topic)
+        requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": [event, event]})
+        time.sleep(1)
+        # Masih di dalam window: duplikat
+        requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        
+        time.sleep(window + 2)
+        requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        time.sleep(2)
+        
+        response = requests.get(f"{AGGREGATOR_URL}/events", params={"topic": topic})
+        assert len(response.json()["events"]) == 2
+
+    def test_batch_per_event_status(self):
+        """Test 29: Respons /publish/batch berisi status per event"""
+        stats_before = requests.get(f"{AGGREGATOR_URL}/stats").json()
+        event = self.create_test_event(topic="edge_dedup_test")
+        response = requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": [event, event]})
+        assert response.status_code == 200
+        
+        result = response.json()
+        assert len(result["statuses"]) == 2
+        assert result["statuses"][0] in ("queued", "processed")
+        
+        edge_dedup = requests.get(f"{AGGREGATOR_URL}/stats").json().get("edge_dedup", {})
+        if edge_dedup.get("enabled"):
+            # Duplikat dalam batch dibuang di Redis sebelum masuk queue
+            assert result["statuses"][1] == "duplicate"
+            assert result["duplicates"] == 1
+            
+            response = requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": [event]})
+            assert response.json()["statuses"] == ["duplicate"]
+            
+            # Duplikat yang dibuang Redis dicatat ke stats oleh consumer, di luar jalur publish
+            time.sleep(3)
+            stats_after = requests.get(f"{AGGREGATOR_URL}/stats").json()
+            assert stats_after["duplicate_dropped_count"] >= stats_before["duplicate_dropped_count"] + 2
+
+    def test_batch_status_long_poll(self):
+        """Test 30: Outcome per event batch lewat GET /batches/{id} dengan long-poll"""
+        existing = self.create_test_event(topic="batch_status_test")
+        requests.post(f"{AGGREGATOR_URL}/publish", json=existing)
+        
+        fresh = self.create_test_event(topic="batch_status_test")
+        response = requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": [fresh, existing, fresh]})
+        batch_id = response.json().get("batch_id")
+        if not batch_id:
+            pytest.skip("Batch tracking requires Redis mode")
+        
+        status = requests.get(f"{AGGREGATOR_URL}/batches/{batch_id}", params={"wait": 10}, timeout=15).json()
+        assert status["status"] == "complete"
+        assert status["outcomes"] == ["new", "duplicate", "duplicate"]
+        
+        response = requests.get(f"{AGGREGATOR_URL}/batches/{uuid.uuid4().hex}")
+        assert response.status_code == 404
+
+    def test_metrics_endpoint(self):
+        """Test 31: /metrics dalam format Prometheus dengan histogram latency per topic"""
+        event = self.create_test_event(topic="metrics_test")
+        requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        requests.get(f"{AGGREGATOR_URL}/events", params={"topic": "metrics_test"})
+        
+        response = requests.get(f"{AGGREGATOR_URL}/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        
+        body = response.text
+        assert '# TYPE aggregator_http_request_duration_seconds histogram' in body
+        assert 'aggregator_http_request_duration_seconds_count{endpoint="/publish",topic="metrics_test"}' in body
+        assert 'aggregator_http_request_duration_seconds_count{endpoint="/events",topic="metrics_test"}' in body
+        assert 'aggregator_db_acquire_seconds_count' in body
+
+    def test_latency_stats(self):
+        """Test 32: Persentil latency end-to-end per topic di /stats/latency"""
+        topic = f"latency_test_{uuid.uuid4().hex[:8]}"
+        events = [self.create_test_event(topic=topic) for _ in range(10)]
+        requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": events})
+        
+        time.sleep(2)
+        
+        response = requests.get(f"{AGGREGATOR_URL}/stats/latency", params={"topic": topic})
+        assert response.status_code == 200
+        
+        accept = response.json()["topics"][topic]["accept"]
+        assert accept["count"] == 10
+        assert 0 <= accept["p50_ms"] <= accept["p95_ms"] <= accept["p99_ms"] <= accept["max_ms"]
+
+    def test_read_replica_routing(self):
+        """Test 33: /events dan /stats dibaca dari READ_DATABASE_URL jika replica sehat"""
+        health = requests.get(f"{AGGREGATOR_URL}/health").json()
+        assert health["status"] == "healthy"
+        if health.get("read_replica") != "healthy":
+            pytest.skip("READ_DATABASE_URL not configured or replica not healthy")
+        
+        before = requests.get(f"{AGGREGATOR_URL}/stats").json()["read_replica"]
+        requests.get(f"{AGGREGATOR_URL}/events", params={"limit": 1})
+        after = requests.get(f"{AGGREGATOR_URL}/stats").json()["read_replica"]
+        
+        assert after["lag_seconds"] <= after["max_lag_seconds"]
+        # /events dan /stats berikutnya masing-masing satu read di replica
+        assert after["reads"] >= before["reads"] + 2
+        assert 'aggregator_db_reads_total{pool="replica"}' in requests.get(f"{AGGREGATOR_URL}/metrics").text
+
+    def test_db_pool_stats(self):
+        """Test 34: Statistik pool (koneksi terpakai, antrian, limiter adaptif) di /stats dan /metrics"""
+        events = [self.create_test_event(topic="pool_stats_test") for _ in range(20)]
+        for event in events:
+            requests.post(f"{AGGREGATOR_URL}/publish", json=event)
+        
+        pool = requests.get(f"{AGGREGATOR_URL}/stats").json()["db_pool"]
+        primary = pool["primary"]
+        assert 0 < primary["size"] <= primary["max_size"]
+        assert primary["in_use"] >= 0 and primary["waiting"] >= 0
+        assert primary["acquired"] > 0
+        
+        if pool["adaptive"]["enabled"]:
+            adaptive = pool["adaptive"]
+            assert adaptive["min_limit"] <= adaptive["limit"] <= adaptive["max_limit"]
+        
+        body = requests.get(f"{AGGREGATOR_URL}/metrics").text
+        assert 'aggregator_db_pool_in_use{pool="primary"}' in body
+        assert 'aggregator_db_pool_waiters{pool="primary"}' in body
+
+    def test_ndjson_stream_decompression_bomb(self):
+        """Test 35: Body gzip/zstd kecil yang mengembang jauh melewati STREAM_MAX_LINE_BYTES ditolak 413"""
+        import gzip
+        zstandard = pytest.importorskip("zstandard")
+        
+        # Ratusan KB terkompresi, 256 MB tanpa newline setelah didekompresi
+        payload = b"0" * (256 * 1024 * 1024)
+        bodies = {"gzip": gzip.compress(payload), "zstd": zstandard.ZstdCompressor().compress(payload)}
+        for encoding, body in bodies.items():
+            response = requests.post(
+                f"{AGGREGATOR_URL}/publish/stream",
+                data=body,
+                headers={"Content-Type": "application/x-ndjson", "Content-Encoding": encoding},
+                timeout=30
+            )
+            assert response.status_code == 413, encoding
+
+    def test_backpressure_load_shedding(self):
+        """Test 36: Queue di atas high watermark ditolak 429 + Retry-After, dilepas di low watermark"""
+        backpressure = requests.get(f"{AGGREGATOR_URL}/stats").json().get("backpressure", {})
+        if not backpressure.get("enabled") or backpressure.get("high_watermark", 0) > 1000:
+            pytest.skip("Requires Redis mode with QUEUE_HIGH_WATERMARK <= 1000")
+        
+        # Batch besar berturut-turut lebih cepat daripada consumer menguras queue
+        batch_size = backpressure["high_watermark"] * 4
+        rejected = None
+        for _ in range(20):
+            events = [self.create_test_event(topic="backpressure_test") for _ in range(batch_size)]
+            response = requests.post(f"{AGGREGATOR_URL}/publish/batch", json={"events": events}, timeout=60)
+            if response.status_code == 429:
+                rejected = response
+                break
+            assert response.status_code == 200
+        
+        assert rejected is not None, "queue never crossed the high watermark"
+        assert 1 <= int(rejected.headers["Retry-After"]) <= 60
+        stats = requests.get(f"{AGGREGATOR_URL}/stats").json()["backpressure"]
+        assert stats["state"] == "throttled"
+        assert stats["rejected_batches"] >= 1
+        
+        # Hysteresis: diterima lagi setelah consumer menguras queue ke low watermark
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            response = requests.post(f"{AGGREGATOR_URL}/publish/batch",
+                                     json={"events": [self.create_test_event(topic="backpressure_test")]}, timeout=30)
+            if response.status_code == 200:
+                break
+            assert response.status_code == 429
+            time.sleep(1)
+        assert response.status_code == 200
+        stats = requests.get(f"{AGGREGATOR_URL}/stats").json()["backpressure"]
+        assert stats["state"] == "open"
+        assert stats["last_queue_length"] <= stats["low_watermark"]
+
 if __name__ == "__main__":
     # Run tests
     pytest.main([__file__, "-v", "--tb=short"])
\ No newline at end of file